@@ -2,11 +2,11 @@
 
 import rt_settings as rt
 from src.static_methods import read_roster_csv, colorize_table
+from src.RT_ics import read_roster_ics
 import click
 import colorful as cf
 from tabulate import tabulate
 from datetime import datetime
-from src.Gcal_API import RTCalendar
 from make_roster import print_rost
 
 year = datetime.now().year
@@ -17,36 +17,96 @@ ukevakt = False
 file_roster = None
 names = None
 emails = None
+batch_size = 50
+reconcile = False
 
 
-def add_shifts_from_file(roster, cal, institution, year):
+def roster_shifts(title, table, institution, year):
     """
-    Reads shifts from roster file and adds them to Google calendar.
-    :param roster: str (path) to roster file generated with make_roster.py
-    :param cal: obj - google calendar service object (RTCalendar / MyCalendar)
+    Shifts in roster table (from read_roster_csv) as add_shift arguments.
+    :param title: str, roster title (institution and year are taken from it if given)
+    :param table: nested list
     :param institution: str (UiT, UiO, UiB,...)
     :param year: str
+    :return: list with dicts (week, names, emails, institution, ukevakt, year)
     """
-    title, header, table = read_roster_csv(roster)
     if title:
         institution = title.split()[0]
         year = title.split()[-1]
 
+    shifts = list()
+    for i in range(len(table)):
+        shift = list(table[i])
+        week = shift[0]
+        names = shift[3].split("/")
+        ukevakt = False
+        if "X" in shift[4]:
+            ukevakt=True
+        emails = shift[5].split("/")
+        shifts.append({"week": week, "names": names, "emails": emails, "institution": institution,
+                       "ukevakt": ukevakt, "year": year})
+    return shifts
+
+
+def read_roster(roster):
+    """
+    :param roster: str (path) to roster file, csv from make_roster.py or .ics
+    :return: title, header, table
+    """
+    if roster.lower().endswith(".ics"):
+        return read_roster_ics(roster)
+    return read_roster_csv(roster)
+
+
+def add_shifts_from_file(roster, cal, institution, year, batch_size=batch_size):
+    """
+    Reads shifts from roster file and adds them to Google calendar.
+    :param roster: str (path) to roster file generated with make_roster.py (csv or .ics)
+    :param cal: obj - google calendar service object (RTCalendar / MyCalendar)
+    :param institution: str (UiT, UiO, UiB,...)
+    :param year: str
+    :param batch_size: int, shifts per batch request (0 adds one shift at a time)
+    """
+    title, header, table = read_roster(roster)
+
     if verify_calendar_push(title, header.copy(), table.copy(), cal):
-        for i in range(len(table)):
-            shift = list(table[i])
-            week = shift[0]
-            names = shift[3].split("/")
-            ukevakt = False
-            if "X" in shift[4]:
-                ukevakt=True
-            emails = shift[5].split("/")
-
-            cal.add_shift(week=week, names=names, emails=emails, institution=institution, ukevakt=ukevakt, year=year)
+        shifts = roster_shifts(title, table, institution, year)
+
+        if batch_size > 0:
+            cal.add_shifts(shifts, batch_size=batch_size)
+        else:
+            for shift in shifts:
+                cal.add_shift(**shift)
     else:
         return
 
 
+def reconcile_from_file(roster, cal, institution, year, batch_size=batch_size):
+    """
+    Updates Google calendar to match roster file, changing only what differs (no duplicates when re-run).
+    Planned changes are shown (dry-run) and must be confirmed before they are applied.
+    :param roster: str (path) to roster file generated with make_roster.py (csv or .ics)
+    :param cal: obj - google calendar service object (RTCalendar)
+    :param institution: str (UiT, UiO, UiB,...)
+    :param year: str
+    :param batch_size: int, changes per batch request
+    """
+    title, header, table = read_roster(roster)
+    shifts = roster_shifts(title, table, institution, year)
+
+    plan = cal.plan_roster(shifts)
+    if not plan:
+        print(cf.green(f"{cal.cal_name} already matches {roster}."))
+        return
+
+    print(cf.blue(f"\nChanges needed in {cal.cal_name} to match {title or roster}:"))
+    cal.print_plan(plan)
+    if input(cf.red("\n-----> Apply changes? (y/n): ")) != "y":
+        print(cf.red("Cancelled by user"))
+        return
+    cal.apply_plan(plan, batch_size=max(1, batch_size))
+
+
 def verify_calendar_push(title, header, table, cal):
     """
     Prints out current roster and forces user to verify before committing to pushing to Google calendar.
@@ -92,14 +152,25 @@ def verify_calendar_push(title, header, table, cal):
     "-u", "--ukevakt", type=bool, default=ukevakt, help=f"Ukevakt (default: {ukevakt})."
 )
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str,
+    default=cal, help=f"Calendar (default: {cal or 'personal calendar'})"
+)
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
+)
+@click.option(
+    "-b", "--batch_size", type=int, default=batch_size,
+    help=f"Shifts per batch request when adding from roster file, 0 adds one at a time (default: {batch_size})."
+)
+@click.option(
+    "-r", "--reconcile", is_flag=True, default=reconcile,
+    help="With roster file: only insert/update/delete what differs from the calendar (dry-run shown first)."
 )
-
 @click.option(
     "-y", "--year", type=int, default=year, help=f"Year to add shift in (default: {year})."
 )
-def main(week, names, file_roster, emails, cal, year, institution, ukevakt):
+@rt.profile_options
+def main(week, names, file_roster, emails, cal, year, institution, ukevakt, batch_size, reconcile, refresh_calendars):
     """
     CLI to add staff to Metacenter RT roster.
 
@@ -109,12 +180,13 @@ def main(week, names, file_roster, emails, cal, year, institution, ukevakt):
         print("Names for shift OR file with roster must be given.")
         return
 
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[cal], scopes=rt.scopes, credentialsfile=rt.secret_file, token=rt.token)
-    if cal != rt.rt_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
 
+    if file_roster and reconcile:
+        reconcile_from_file(file_roster, rt_cal, institution, year, batch_size)
+        return
     if file_roster:
-        add_shifts_from_file(file_roster, rt_cal, institution, year)
+        add_shifts_from_file(file_roster, rt_cal, institution, year, batch_size)
         return
 
     add_shift = "y"
@@ -129,4 +201,4 @@ def main(week, names, file_roster, emails, cal, year, institution, ukevakt):
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
@@ -2,10 +2,14 @@
 
 import rt_settings as rt
 import click
-from src.Gcal_API import RTCalendar
+from datetime import datetime
 
 cal = rt.default_cal
 event_id = None
+week = None
+year = datetime.now().year
+next_shift = False
+institution = None
 
 
 @click.command()
@@ -13,25 +17,43 @@ event_id = None
     "-id", "--event_id", type=str, help="ID of event to remove from calendar."
 )
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str,
+    default=cal, help=f"Calendar (default: {cal or 'personal calendar'})"
 )
-def main(event_id, cal):
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
+)
+@click.option(
+    "-wk", "--week", type=int, default=week, help="Week number of shift (as in the roster), instead of event ID."
+)
+@click.option(
+    "-y", "--year", type=int, default=year, help=f"Year for week (default: {year})."
+)
+@click.option(
+    "--next", "next_shift", is_flag=True, default=next_shift, help="Next shift of attendee, instead of event ID."
+)
+@click.option(
+    "-i", "--institution", type=str, default=institution, help="Institution of shift, if several in week."
+)
+@rt.profile_options
+def main(event_id, cal, week, year, next_shift, institution, refresh_calendars):
     """
     Simple CLI to delete Google calendar events. Get the ID from 'print_events.py'.
 
     Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
     """
-    if not event_id:
-        print("No event ID given. Aborting.")
+    if not event_id and not week and not next_shift:
+        print("No event ID, week or --next given. Aborting.")
         return
 
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[cal], scopes=rt.scopes, credentialsfile=rt.secret_file, token=rt.token)
-    if cal != rt.default_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
+    event_id = rt.resolve_event_id(rt_cal, event_id, week=week, year=year, next_shift=next_shift,
+                                   institution=institution)
+    if not event_id:
+        return
 
     rt_cal.delete_event(event_id)
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
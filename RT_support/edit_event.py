@@ -1,10 +1,14 @@
 
 import rt_settings as rt
 import click
-from src.Gcal_API import RTCalendar
+from datetime import datetime
 
 cal = rt.default_cal
 event_id = None
+week = None
+year = datetime.now().year
+next_shift = False
+institution = None
 do_what = "add"
 do_where = "attendee"
 # new_value is new text or attendee email... False is for delete events... not needed for that
@@ -15,8 +19,11 @@ sentence = None
 
 @click.command()
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str,
+    default=cal, help=f"Calendar (default: {cal or 'personal calendar'})"
+)
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
 )
 @click.option(
     "-d", "--do_what", type=click.Choice(["add", "replace", "delete"], case_sensitive=True),
@@ -35,7 +42,20 @@ sentence = None
 @click.option(
     "-id", "--event_id", type=str, default=event_id, help="ID of event to edit in calendar."
 )
-def main(do_what, event_id, do_where, new_value, replace, cal):
+@click.option(
+    "-wk", "--week", type=int, default=week, help="Week number of shift (as in the roster), instead of event ID."
+)
+@click.option(
+    "-y", "--year", type=int, default=year, help=f"Year for week (default: {year})."
+)
+@click.option(
+    "--next", "next_shift", is_flag=True, default=next_shift, help="Next shift of attendee, instead of event ID."
+)
+@click.option(
+    "-i", "--institution", type=str, default=institution, help="Institution of shift, if several in week."
+)
+@rt.profile_options
+def main(do_what, event_id, do_where, new_value, replace, cal, week, year, next_shift, institution, refresh_calendars):
     """
     Simple CLI to edit/add/delete something in existing event with event ID.
 
@@ -46,14 +66,15 @@ def main(do_what, event_id, do_where, new_value, replace, cal):
         print(sentence)
         return
 
-    if not event_id:
-        print("No event ID given. Aborting.")
+    if not event_id and not week and not next_shift:
+        print("No event ID, week or --next given. Aborting.")
         return
 
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[cal], scopes=rt.scopes, credentialsfile=rt.secret_file, token=rt.token)
-
-    if cal != rt.default_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
+    event_id = rt.resolve_event_id(rt_cal, event_id, week=week, year=year, next_shift=next_shift,
+                                   institution=institution)
+    if not event_id:
+        return
 
     print(f"Will {do_what} {do_where} for event ID {event_id} in {cal}")
 
@@ -92,4 +113,4 @@ def main(do_what, event_id, do_where, new_value, replace, cal):
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
@@ -2,40 +2,72 @@
 
 import rt_settings as rt
 import click
-from src.Gcal_API import RTCalendar
+from datetime import datetime
 
 cal = rt.default_cal
 event_id = None
+week = None
+year = datetime.now().year
+next_shift = False
+institution = None
+all_unconfirmed = False
+weeks = 4
 response = "accepted"
 attendee = rt.attendee
 
 @click.command()
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str,
+    default=cal, help=f"Calendar (default: {cal or 'personal calendar'})"
+)
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
 )
 @click.option(
     "-id", "--event_id", type=str, default=event_id, help="ID of event to send attendee reminder(s) to."
 )
-
-
-def main(event_id, cal):
+@click.option(
+    "-wk", "--week", type=int, default=week, help="Week number of shift (as in the roster), instead of event ID."
+)
+@click.option(
+    "-y", "--year", type=int, default=year, help=f"Year for week (default: {year})."
+)
+@click.option(
+    "--next", "next_shift", is_flag=True, default=next_shift, help="Next shift of attendee, instead of event ID."
+)
+@click.option(
+    "-i", "--institution", type=str, default=institution, help="Institution of shift, if several in week."
+)
+@click.option(
+    "-a", "--all_unconfirmed", is_flag=True, default=all_unconfirmed,
+    help="Remind attendees in all events where someone has not responded (the next --weeks)."
+)
+@click.option(
+    "-n", "--weeks", type=int, default=weeks, help=f"Weeks ahead for --all_unconfirmed (default: {weeks})."
+)
+@rt.profile_options
+def main(event_id, cal, week, year, next_shift, institution, all_unconfirmed, weeks, refresh_calendars):
     """
     Simple CLI to send email reminder for to Google calendar event. Get the ID from 'print_events.py'.
 
     Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
     """
-    if not event_id:
-        print("No event ID given. Aborting.")
+    if all_unconfirmed:
+        rt.open_calendar(cal, refresh_calendars=refresh_calendars).remind_unconfirmed(weeks=weeks)
         return
 
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[cal], scopes=rt.scopes, credentialsfile=rt.secret_file, token=rt.token)
+    if not event_id and not week and not next_shift:
+        print("No event ID, week or --next given. Aborting.")
+        return
 
-    if cal != rt.default_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
+    event_id = rt.resolve_event_id(rt_cal, event_id, week=week, year=year, next_shift=next_shift,
+                                   institution=institution)
+    if not event_id:
+        return
 
     rt_cal.remind_event(event_id=event_id)
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
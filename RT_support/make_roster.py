@@ -7,49 +7,126 @@ staff members settings can be adjusted as needed (frequency, shared shifts, ukev
 import random
 import datetime
 from src.static_methods import week_to_date
-from distutils.util import strtobool
+from src.RT_ics import write_ics, rost_shifts, ics_shifts, shifts_to_rosts
+from src.RT_solver import solve_rost, load_deviation, Fairness, improve_rost
 from tabulate import tabulate
 import colorful as cf
 import click
+import time
 import sys
-import re
-import os.path
+import os
 import csv
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 
 cf.update_palette({"blue": "#2e54ff"})
 cf.update_palette({"green": "#08a91e"})
 cf.update_palette({"orange": "#ff5733"})
 
 
+class StaffMember:
+    """
+    Staff member in a roster, with settings from the staff list parsed to their types (see default_rost_settings).
+    """
+    __slots__ = ("name", "email", "frequency", "ukevakt", "shared")
+
+    def __init__(self, name, email=None, frequency=1.0, ukevakt=True, shared=False):
+        self.name = name
+        self.email = email
+        self.frequency = frequency
+        self.ukevakt = ukevakt
+        self.shared = shared
+
+    def __repr__(self):
+        return (f"StaffMember(name={self.name!r}, email={self.email!r}, frequency={self.frequency}, "
+                f"ukevakt={self.ukevakt}, shared={self.shared})")
+
+
+def parse_bool(value):
+    """
+    :param value: str, y, yes, t, true, on, 1 or n, no, f, false, off, 0 (any case)
+    :return: bool
+    """
+    value = value.strip().lower()
+    if value in ("y", "yes", "t", "true", "on", "1"):
+        return True
+    if value in ("n", "no", "f", "false", "off", "0"):
+        return False
+    raise ValueError(f"expected True or False, got '{value}'")
+
+
+def parse_frequency(value):
+    """
+    :param value: str
+    :return: float >= 0
+    """
+    frequency = float(value)
+    if frequency < 0:
+        raise ValueError(f"frequency can not be negative, got {value}")
+    return frequency
+
+
+# Column parsers for staff list (columns not listed here are ignored)
+staff_columns = {"email": str, "frequency": parse_frequency, "ukevakt": parse_bool, "shared": parse_bool}
+
+
 def read_staff_list(staff):
     """
     :param staff: filepath to list containing staff. Must at minimum contain header #name.
-    :return: dictionary with staff members
+    :return: dictionary with staff members {name: StaffMember}
     """
     if not os.path.isfile(staff):
         print(f"\nCould not find any file {staff} for staff to include in rost.\n"
               f"aborting...")
         sys.exit()
 
-    headers = list()
+    headers = None
     staff_members = dict()
-    with open(staff, "r") as stafflist:
-        for line in stafflist:
-            line = re.sub("[\t\n]*", "", line)
-            if "#" in line:
-                headers += [h.lower().replace("#","").strip() for h in line.split(",")]
-                if not "name" in headers:
-                    print("could not find #name in staff list.\nAborting...")
-                    sys.exit()
-            elif len(line.split(",")) == len(headers):
-                member = [h.strip() for h in line.split(",")]
-                name = member[headers.index("name")]
-                staff_members[name] = default_rost_settings()
-                for head in headers:
-                    if head != "name":
-                        staff_members[name][head] = member[headers.index(head)]
-            elif len(line.split(",")) == 0:
-                print(f"Mismatch between headers and entry in staff list;\n-->{line}")
+    errors = list()
+    with open(staff, "r", newline="", encoding="utf-8-sig") as stafflist:
+        for line_nr, row in enumerate(csv.reader(stafflist), start=1):
+            row = [column.strip() for column in row]
+            if not any(row):
+                continue
+            if headers is None:
+                if "#" not in "".join(row):
+                    errors.append(f"line {line_nr}: staff member before header (#name, #email...)")
+                    continue
+                headers = [h.lower().replace("#", "").strip() for h in row]
+                if "name" not in headers:
+                    raise SystemExit("ABORTING: could not find #name in staff list.")
+                ignored = [h for h in headers if h != "name" and h not in staff_columns]
+                if ignored:
+                    print(f"Ignoring column(s) {', '.join(ignored)} in {staff}")
+                continue
+            if row[0].startswith("#"):
+                continue
+            if len(row) != len(headers):
+                errors.append(f"line {line_nr}: expected {len(headers)} columns, got {len(row)} -->{','.join(row)}")
+                continue
+
+            name = row[headers.index("name")]
+            if not name:
+                errors.append(f"line {line_nr}: missing name")
+                continue
+            if name in staff_members:
+                errors.append(f"line {line_nr}: {name} is already in staff list")
+                continue
+
+            member = StaffMember(name, **default_rost_settings())
+            for head, value in zip(headers, row):
+                if head not in staff_columns:
+                    continue
+                try:
+                    setattr(member, head, staff_columns[head](value))
+                except ValueError as err:
+                    errors.append(f"line {line_nr}: {head} of {name}: {err}")
+            staff_members[name] = member
+
+    if headers is None:
+        raise SystemExit("ABORTING: could not find #name in staff list.")
+    if errors:
+        raise SystemExit(f"ABORTING: {len(errors)} error(s) in {staff}:\n" + "\n".join(errors))
     return staff_members
 
 
@@ -61,11 +138,54 @@ def default_rost_settings():
     return {"email": None, "frequency": 1.0, "ukevakt": True, "shared": False}
 
 
-def find_next_shift(names_order, rost, staff, ukevakt=False):
+class RosterState:
+    """
+    Shift rounds of a roster being populated. Shifts per staff member are counted as they are assigned, so the
+    frequency of a staff member (shifts per completed round) is found without scanning earlier rounds.
+    """
+    def __init__(self):
+        # Completed rounds, and shifts per staff member in completed rounds {name: shifts}
+        self.rounds = 0
+        self.shifts = dict()
+        # Shifts per staff member in the current round {name: shifts}
+        self.current = dict()
+
+    def assign(self, who):
+        """
+        :param who: name of staff member given a shift in the current round
+        """
+        self.current[who] = self.current.get(who, 0) + 1
+
+    def new_round(self):
+        """
+        Complete the current round (also if empty) and start a new one.
+        """
+        for who, shifts in self.current.items():
+            self.shifts[who] = self.shifts.get(who, 0) + shifts
+        self.current.clear()
+        self.rounds += 1
+
+    def frequency(self, who, current_round=False):
+        """
+        :param who: Name
+        :param current_round: bool, count the current round as completed
+        :return: Occurence of who in rounds (fraction of 1)
+        """
+        rounds = self.rounds
+        shifts = self.shifts.get(who, 0)
+        if current_round:
+            rounds += 1
+            shifts += self.current.get(who, 0)
+        if rounds == 0:
+            return 0
+        return shifts / rounds
+
+
+def find_next_shift(names_order, state, staff, ukevakt=False):
     """
     :param names_order: The order of names from random seed
-    :param rost: current roster
-    :param staff: dict with staff members
+    :param state: RosterState, current roster
+    :param staff: dict with staff members {name: StaffMember}
     :param ukevakt: bool
     :return:
     """
@@ -73,42 +193,26 @@ def find_next_shift(names_order, rost, staff, ukevakt=False):
     for name in names_order:
         assign = True
         if ukevakt:
-            if not strtobool(staff[name]["ukevakt"]):
+            if not staff[name].ukevakt:
                 assign = False
-        if float(staff[name]["frequency"]) >= current_frequency(name, rost):
+        if staff[name].frequency >= state.frequency(name):
             if assign:
                 return name
     return who
 
 
-def current_frequency(who, staff_shifts):
-    """
-    Calculates the frequency of shifts in roster for staff member 'who'.
-    :param who: Name
-    :param staff_shifts: list with shifts, where each shift is a list of names for that shift
-    :return: Occurence of who in shifts (fraction of 1)
-    """
-    if len(staff_shifts) == 0:
-        return 0
-    shifts = 0
-
-    for shift in staff_shifts:
-        shifts += shift.count(who)
-
-    return shifts / len(staff_shifts)
-
-
-def staff_sharing(who, staff_shifts, staff):
+def staff_sharing(who, state, staff):
     """
     Find staff members that share shifts in roster.
+    :param state: RosterState, current roster
     :param staff: complete staff dict
     :return: list with names that can share shift, if frequency not over the limit
     """
     partners = list()
     for name in staff.keys():
         if name != who:
-            if strtobool(staff[name]["shared"]):
-                if float(staff[name]["frequency"]) >= current_frequency(name, staff_shifts):
+            if staff[name].shared:
+                if staff[name].frequency >= state.frequency(name):
                     partners.append(name)
 
     if len(partners) == 0:
@@ -117,22 +221,22 @@ def staff_sharing(who, staff_shifts, staff):
         return partners
 
 
-def find_share_partner(who, names_order, staff_shifts, staff):
+def find_share_partner(who, names_order, state, staff):
     """
     Look for a partner to share weekly shift with. First look for others that share, than anyone.
     :param who: person searching for a partner to share shift with
     :param names_order: Order of remaining staff members in current round
-    :param rost: Current rost list
+    :param state: RosterState, current roster
     :param staff: complete staff dict
     :return: name
     """
-    partners = staff_sharing(who, staff_shifts, staff)
+    partners = staff_sharing(who, state, staff)
 
     if not partners:
         partners = names_order.copy()
 
     for name in partners:
-        if float(staff[name]["frequency"]) >= current_frequency(name, staff_shifts):
+        if staff[name].frequency >= state.frequency(name):
             return name
 
     return None
@@ -252,7 +356,7 @@ def populate_rost(from_week, to_week, seed, ukevakt, staff):
     :param to_week: int
     :param year: int
     :param ukevakt: list (week numbers with ukevakt)
-    :param staff: dict (staff members and settings)
+    :param staff: dict (staff members and settings) {name: StaffMember}
     :return: dict (roster) and int (iterations in roster)
     """
     rost = dict()
@@ -263,8 +367,7 @@ def populate_rost(from_week, to_week, seed, ukevakt, staff):
     names_random = random.sample(list(staff.keys()), len(staff))
 
     staff_avail = names_random.copy()
-    staff_shifts = list()
-    shift = list()
+    state = RosterState()
     this_weeks_staff = list()
 
     for week in range(from_week, to_week + 1):
@@ -279,47 +382,78 @@ def populate_rost(from_week, to_week, seed, ukevakt, staff):
 
         if len(staff_avail) == 0:
             staff_avail = names_random.copy()
-            staff_shifts.append(shift.copy())
-            shift.clear()
+            state.new_round()
 
-        who = find_next_shift(staff_avail, staff_shifts, staff, rost[week]["ukevakt"])
+        who = find_next_shift(staff_avail, state, staff, rost[week]["ukevakt"])
 
         if not who:
             staff_avail = names_random.copy()
-            staff_shifts.append(shift.copy())
-            shift.clear()
-            who = find_next_shift(staff_avail, staff_shifts, staff, rost[week]["ukevakt"])
+            state.new_round()
+            who = find_next_shift(staff_avail, state, staff, rost[week]["ukevakt"])
 
         rost[week]["who"].append(who)
-        rost[week]["email"].append(staff[who]["email"])
-        shift.append(who)
+        rost[week]["email"].append(staff[who].email)
+        state.assign(who)
         staff_avail.remove(who)
         this_weeks_staff.append(who)
 
         # Check for sharing:
-        if strtobool(staff[who]["shared"]):
-            partner = find_share_partner(who, staff_avail, staff_shifts, staff)
+        if staff[who].shared:
+            partner = find_share_partner(who, staff_avail, state, staff)
             if not partner:
                 staff_avail = names_random.copy()
-                staff_shifts.append(shift.copy())
-                shift.clear()
-                partner = find_share_partner(who, staff_avail, staff_shifts, staff)
+                state.new_round()
+                partner = find_share_partner(who, staff_avail, state, staff)
             rost[week]["who"].append(partner)
-            rost[week]["email"].append(staff[partner]["email"])
-            staff_avail.remove(partner)
-            shift.append(partner)
+            rost[week]["email"].append(staff[partner].email)
+            # Sharing partners may already have had their shift in this round
+            if partner in staff_avail:
+                staff_avail.remove(partner)
+            state.assign(partner)
 
         # Check staff frequency, and add staff to end of staff_avail again if possible
-        tmp_shifts = staff_shifts.copy()
-        tmp_shifts.append(shift.copy())
         for u in this_weeks_staff:
-            if float(staff[u]["frequency"]) > current_frequency(who, tmp_shifts):
+            if staff[u].frequency > state.frequency(who, current_round=True):
                 print(f"One more round for {who}")
                 staff_avail.append(who)
 
-    staff_shifts.append(shift.copy())
+    state.new_round()
+
+    return rost, state.rounds
 
-    return rost, len(staff_shifts)
+
+def generate_rost(engine, from_week, to_week, seed, ukevakt, staff):
+    """
+    :param engine: str, greedy (populate_rost) or exact (solve_rost)
+    :return: dict (roster) and int (iterations in roster)
+    """
+    if engine == "exact":
+        return solve_rost(from_week, to_week, seed, ukevakt, staff)
+    return populate_rost(from_week, to_week, seed, ukevakt, staff)
+
+
+def score_seed(engine, from_week, to_week, seed, ukevakt, staff):
+    """
+    Roster from one seed with its fairness score (run in worker processes of search_seeds, output is hidden).
+    :return: float (score), int (seed), dict (roster), int (iterations in roster)
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        rost, shift_rounds = generate_rost(engine, from_week, to_week, seed, ukevakt, staff)
+    return Fairness.of_rost(rost, staff).score(rost), seed, rost, shift_rounds
+
+
+def search_seeds(engine, from_week, to_week, seeds, ukevakt, staff, workers=None):
+    """
+    Generate a roster for each seed in a process pool, and keep the fairest (lowest Fairness score, ties: first seed).
+    :param seeds: list with seeds
+    :param workers: int, processes (default: all cores)
+    :return: float (score), int (seed), dict (roster), int (iterations in roster)
+    """
+    n = len(seeds)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(score_seed, [engine] * n, [from_week] * n, [to_week] * n, seeds, [ukevakt] * n,
+                           [staff] * n, chunksize=max(1, n // (4 * (workers or os.cpu_count() or 1))))
+        return min(results, key=lambda result: result[:2])
 
 
 year = datetime.datetime.now().year
@@ -330,6 +464,13 @@ first_ukevakt = 1
 ukevakt_frequency = 4
 staff = "staff.csv"
 write_file = False
+ics_file = None
+ics_roster = None
+engines = ["greedy", "exact"]
+engine = "greedy"
+search = 0
+workers = None
+improve_seconds = 0.0
 
 @click.command()
 @click.option(
@@ -358,12 +499,46 @@ write_file = False
 @click.option(
     "--seed", type=int, default=seed, help=f"seed used for random order of staff in rost. Now using {seed}."
 )
-def main(staff, year, from_week, to_week, seed, first_ukevakt, ukevakt_frequency, write_file):
+@click.option(
+    "-ics", "--write_ics", "ics_file", type=str, default=ics_file,
+    help="Write roster to this .ics file (iCalendar), for import in any calendar."
+)
+@click.option(
+    "-ri", "--read_ics", "ics_roster", type=str, default=ics_roster,
+    help="Print roster from .ics file instead of generating one (write it to csv with -wf True)."
+)
+@click.option(
+    "-e", "--engine", type=click.Choice(engines), default=engine,
+    help=f"greedy: staff in random order (seed), exact: load as close to frequency as possible (default: {engine})."
+)
+@click.option(
+    "--search", type=int, default=search,
+    help="Generate rosters from this many seeds (from --seed and up) and keep the fairest (load vs frequency, "
+         "ukevakt spread, short gaps between shifts)."
+)
+@click.option(
+    "--workers", type=int, default=workers, help="Processes used by --search (default: all cores)."
+)
+@click.option(
+    "--improve_seconds", type=float, default=improve_seconds,
+    help="Improve the roster by local search (moves and swaps of shifts lowering the fairness score) for up to this "
+         "many seconds, stops earlier when no move improves it (default: no local search)."
+)
+def main(staff, year, from_week, to_week, seed, first_ukevakt, ukevakt_frequency, write_file, ics_file, ics_roster,
+         engine, search, workers, improve_seconds):
     """
     CLI for generating a roster over a period of time from a list of staff members (.csv)
 
     Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
     """
+    if ics_roster:
+        if not os.path.isfile(ics_roster):
+            raise SystemExit(f"ABORTING: Could not find {ics_roster}.")
+        rosts = shifts_to_rosts(ics_shifts(ics_roster))
+        for rost_year in sorted(rosts.keys()):
+            print_rost(rosts[rost_year], rost_year, write_file)
+        return
+
     if from_week == datetime.datetime.now().isocalendar()[1] and year != datetime.datetime.now().year:
         from_week = 1
 
@@ -375,11 +550,45 @@ def main(staff, year, from_week, to_week, seed, first_ukevakt, ukevakt_frequency
     print("\n\nGenerating RT support rost with the following settings:")
     print(f"Year: {year}\nFirst week: {from_week}\nFinal week: {to_week}\nFirst ukevakt: {first_ukevakt}\n"
           f"Ukevakt frequency:{ukevakt_frequency}\nUkevakt: {', '.join(map(str, ukevakt))}\n"
-          f"Staff: {', '.join(sorted(staff_members.keys()))}\nRandom seed: {seed}\n")
+          f"Staff: {', '.join(sorted(staff_members.keys()))}\nRandom seed: {seed}\nEngine: {engine}\n")
+
+    start = time.perf_counter()
+    if search > 1:
+        score, seed, rost, shifts = search_seeds(engine, from_week, to_week, list(range(seed, seed + search)), ukevakt,
+                                                 staff_members, workers=workers)
+    else:
+        rost, shifts = generate_rost(engine, from_week, to_week, seed, ukevakt, staff_members)
+    solve_time = time.perf_counter() - start
+
+    improved = None
+    if improve_seconds > 0:
+        improved = improve_rost(rost, staff_members, improve_seconds, seed=seed)
 
-    rost, shifts = populate_rost(from_week, to_week, seed, ukevakt, staff_members)
     print_rost(rost, year, write_file)
     print_stats(rost, shifts)
+    print(f"Engine {engine}: solved in {solve_time * 1000:.1f} ms, load deviation from frequency "
+          f"{load_deviation(rost, staff_members):.4f} (sum of (load - fair share)^2, in weeks)")
+    fairness = Fairness.of_rost(rost, staff_members).breakdown(rost)
+    print(f"Fairness score: {sum(fairness.values()):.4f} "
+          f"({', '.join(f'{term} {value:.4f}' for term, value in fairness.items())})")
+    if search > 1:
+        print(f"Best of {search} seeds: {seed} (reproduce with --seed {seed})")
+    if improved:
+        if improved["repaired"]:
+            print(f"Local search: {improved['repaired']} week(s) with the same staff member twice given to that staff "
+                  f"member alone")
+        if not improved["moves"]:
+            stopped = "no allowed moves"
+        elif improved["local_optimum"]:
+            stopped = "local optimum"
+        else:
+            stopped = "time budget used"
+        print(f"Local search: {improved['improvements']} of {improved['moves']} moves improved the fairness score "
+              f"from {improved['before']:.4f} to {improved['after']:.4f} in {improved['seconds']:.2f} s ({stopped})")
+
+    if ics_file:
+        write_ics(ics_file, rost_shifts(rost, year), name=f"UiT RT SUPPORT {year}")
+        print(f"Roster written to {ics_file}")
 
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@
 import rt_settings as rt
 import click
 from datetime import datetime
-from src.Gcal_API import RTCalendar
+from src.static_methods import output_formats
 
 cal = rt.default_cal
 week1 = datetime.now().isocalendar()[1]
@@ -11,11 +11,28 @@ week2 = None
 year1 = datetime.now().year
 year2 = year1
 when = "today"
+page_size = 250
+mirror = rt.use_mirror
+all_calendars = False
+workers = 8
+output = "grid"
+color = "auto"
+pager = False
 
 @click.command()
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str, multiple=True,
+    default=[cal] if cal else [], help=f"Calendar, several for a combined table (default: {cal or 'personal calendar'})"
+)
+@click.option(
+    "-ac", "--all_calendars", is_flag=True, default=all_calendars, help="Print events from all available calendars."
+)
+@click.option(
+    "--workers", type=int, default=workers,
+    help=f"Max calendars queried concurrently with several calendars (default: {workers})."
+)
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
 )
 @click.option(
     "-w", "--when", type=click.Choice(["today", "week", "month", "year"], case_sensitive=False),
@@ -33,16 +50,58 @@ when = "today"
 @click.option(
     "-y2", "--year2", type=int, default=year2, help=f"Year for week2 (default: {year2})."
 )
-def main(when, cal, week1, year1, week2, year2):
+@click.option(
+    "-p", "--page_size", type=int, default=page_size,
+    help=f"Events fetched per request, printed as they arrive (default: {page_size})."
+)
+@click.option(
+    "-m", "--mirror", type=bool, default=mirror,
+    help=f"Print shift calendar ({rt.rt_cal}) from local mirror, synced with changes only (default: {mirror})."
+)
+@click.option(
+    "-f", "--format", "output", type=click.Choice(output_formats),
+    default=output,
+    help=f"Output format, printed while events arrive. All but grid are for other tools (default: {output})."
+)
+@click.option(
+    "--color", type=click.Choice(["auto", "always", "never"]), default=color,
+    help=f"Colored grid. auto: only when printing to a terminal (default: {color})."
+)
+@click.option(
+    "--pager", is_flag=True, default=pager, help="Page the grid with $PAGER (less) when printing to a terminal."
+)
+@rt.profile_options
+def main(when, cal, all_calendars, workers, week1, year1, week2, year2, page_size, mirror, output, color, pager,
+         refresh_calendars):
     """
     CLI to print Google calendar events.
 
     Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
     """
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[rt.default_cal], scopes=rt.scopes, credentialsfile=rt.secret_file,
-                        token=rt.token)
-    if cal != rt.default_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    rt_cal = rt.open_calendar(cal[0] if cal else None, refresh_calendars=refresh_calendars)
+    rt_cal.set_page_size(page_size)
+    rt_cal.set_output(output, color={"auto": None, "always": True, "never": False}[color], pager=pager)
+
+    if all_calendars or len(cal) > 1:
+        calendars = rt.calendar_choices()
+        if not all_calendars:
+            for name in cal:
+                if name not in calendars:
+                    raise SystemExit(f"ABORTING: Found no calendar named {name}.\n"
+                                     f"Available calendars: {', '.join(calendars)}")
+            calendars = list(cal)
+
+        if week1 != datetime.now().isocalendar()[1] or week2:
+            rt_cal.get_print_calendars(calendars, week1=week1, year1=year1, week2=week2, year2=year2,
+                                       workers=workers)
+        else:
+            rt_cal.get_print_calendars(calendars, when=when, workers=workers)
+        return
+
+    if mirror and rt_cal.cal_name in rt.mirror_calendars:
+        rt_cal.use_mirror(rt.event_mirror, max_age=rt.mirror_max_age)
+    else:
+        rt_cal.mirror = None
 
     if week1 != datetime.now().isocalendar()[1] or week2:
         rt_cal.get_print_weeks(week1=week1, year1=year1, week2=week2, year2=year2)
@@ -51,4 +110,4 @@ def main(when, cal, week1, year1, week2, year2):
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
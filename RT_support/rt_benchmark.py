@@ -0,0 +1,155 @@
+###!venv/bin/python3
+
+import rt_settings as rt
+import click
+import os
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from tabulate import tabulate
+from src.Gcal_API import RTCalendar, event_fields, batch_limit
+from src.Gcal_executor import RequestExecutor
+from src.Gcal_fake import FakeCalendarBackend, FakeHttp, fake_calendars
+from src.static_methods import date_to_week
+
+sizes = [10, 100, 1000, 10000]
+operations = ["publish", "list", "swap", "edit"]
+latency = 0.0
+quota_errors = 0.0
+rate = None
+batch_size = batch_limit
+max_swaps = 20
+seed = 42
+
+
+def fake_calendar(backend, rate=None):
+    """
+    RTCalendar working on a FakeCalendarBackend (no Google account or network needed).
+    :param backend: FakeCalendarBackend
+    :param rate: float, requests per second (None: no rate limit)
+    :return: RTCalendar
+    """
+    executor = RequestExecutor(rate=rate or 1e9, burst=batch_limit, max_concurrency=rt.max_concurrent_requests,
+                               max_retries=rt.max_retries, base_delay=0.01, max_delay=0.5)
+    calendar_id = [cal_id for cal_id, name in fake_calendars.items() if name == rt.rt_cal][0]
+    return RTCalendar(calendar_id=calendar_id, token="fake", http=FakeHttp(backend), calendar_cache=None,
+                      executor=executor)
+
+
+def roster_shifts(n, first_day=date(2030, 1, 7)):
+    """
+    :param n: int, number of shifts (one per week from first_day, a monday)
+    :return: list with add_shift arguments (weeks as in the roster, see date_to_week)
+    """
+    shifts = list()
+    for i in range(n):
+        year, week = date_to_week(first_day + timedelta(weeks=i))
+        shifts.append({"week": week, "year": year, "names": [f"Staff{i % 17}", f"Staff{(i + 5) % 17}"],
+                       "emails": [f"staff{i % 17}@example.com", f"staff{(i + 5) % 17}@example.com"],
+                       "institution": "UiT", "ukevakt": i % 4 == 0})
+    return shifts
+
+
+def benchmark(n, ops, latency=0.0, quota_errors=0.0, rate=None, batch_size=batch_limit, max_swaps=max_swaps,
+              seed=seed):
+    """
+    Time roster publish (batch insert), listing, swaps and bulk edit (batch patch) of n shifts on a fake backend.
+    Output of the calendar methods (tables) is rendered, but not shown.
+    :return: list with table rows [events, operation, items, seconds, items/s, API calls, HTTP requests, quota errors]
+    """
+    backend = FakeCalendarBackend(latency=latency, quota_error_rate=quota_errors, seed=seed)
+    cal = fake_calendar(backend, rate=rate)
+    shifts = roster_shifts(n)
+    last_day = str(date(2030, 1, 7) + timedelta(weeks=n))
+
+    def listed(fields=event_fields["list"]):
+        return list(cal.get_events("2030-01-01", last_day, fields=fields))
+
+    rows = list()
+
+    def measure(operation, function, show=True):
+        backend.reset_stats()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            items = function()
+        seconds = time.perf_counter() - start
+        if show:
+            rows.append([n, operation, items, f"{seconds:.3f}", f"{items / seconds:.1f}" if seconds else "",
+                         backend.stats["calls"], backend.stats["http"], backend.stats["quota_errors"]])
+
+    def publish():
+        results = cal.add_shifts(shifts, batch_size=batch_size)
+        return len([error for event, error in results if error is None])
+
+    def swap():
+        events = listed(fields=event_fields["swap"])
+        swaps = 0
+        for i in range(0, min(len(events) - 1, 2 * max_swaps), 2):
+            swaps += cal.swap_shifts(events[i]["id"], events[i + 1]["id"])
+        return swaps
+
+    def edit():
+        events = listed(fields=event_fields["swap"])
+        results = cal.patch_events(events, [{"summary": f"{event['summary']} (edited)"} for event in events])
+        return len([error for response, error in results.values() if error is None])
+
+    # The other operations work on the published roster
+    measure("publish", publish, show="publish" in ops)
+    if "list" in ops:
+        measure("list", lambda: len(listed()))
+    if "swap" in ops:
+        measure("swap", swap)
+    if "edit" in ops:
+        measure("edit", edit)
+    return rows
+
+
+@click.command()
+@click.option(
+    "-n", "--events", type=int, multiple=True, default=sizes,
+    help=f"Number of shifts (events) to benchmark with. Multiple (default: {', '.join(map(str, sizes))})."
+)
+@click.option(
+    "-o", "--operation", type=click.Choice(operations), multiple=True, default=operations,
+    help=f"Operations to time. Multiple (default: {', '.join(operations)})."
+)
+@click.option(
+    "-l", "--latency", type=float, default=latency,
+    help=f"Seconds for each HTTP round trip to the fake calendar (default: {latency})."
+)
+@click.option(
+    "-q", "--quota_errors", type=float, default=quota_errors,
+    help=f"Fraction (0-1) of API calls answered with 403 rateLimitExceeded (default: {quota_errors})."
+)
+@click.option(
+    "-r", "--rate", type=float, default=rate,
+    help="Requests per second through the request executor (default: no limit)."
+)
+@click.option(
+    "-b", "--batch_size", type=int, default=batch_size, help=f"Requests per batch request (default: {batch_size})."
+)
+@click.option(
+    "--max_swaps", type=int, default=max_swaps, help=f"Max number of swaps timed (default: {max_swaps})."
+)
+@click.option(
+    "--seed", type=int, default=seed, help=f"Seed for random quota errors (default: {seed})."
+)
+def main(events, operation, latency, quota_errors, rate, batch_size, max_swaps, seed):
+    """
+    Benchmark of the calendar layer (RTCalendar) against an in-memory fake Google calendar: roster publish,
+    listing, swaps and bulk edit, with optional latency and quota errors. No Google account or network needed.
+
+    Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
+    """
+    rows = list()
+    for n in events:
+        print(f"Benchmarking {n} events...")
+        rows += benchmark(n, operation, latency=latency, quota_errors=quota_errors, rate=rate, batch_size=batch_size,
+                          max_swaps=max_swaps, seed=seed)
+
+    print(tabulate(rows, ["Events", "Operation", "Items", "Seconds", "Items/s", "API calls", "HTTP requests",
+                          "Quota errors"], tablefmt="pretty", stralign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+###!venv/bin/python3
+
+import rt_settings as rt
+import click
+from src.Gcal_daemon import CalendarDaemon, stop_daemon
+
+stop = False
+mirror_max_age = 60
+
+
+@click.command()
+@click.option(
+    "-s", "--stop", is_flag=True, default=stop, help="Stop running daemon."
+)
+@click.option(
+    "-a", "--mirror_max_age", type=int, default=mirror_max_age,
+    help=f"Seconds before event mirror is synced with Google again (default: {mirror_max_age})."
+)
+def main(stop, mirror_max_age):
+    """
+    Background daemon keeping credentials, the calendar service and caches warm. While it runs, the calendar CLIs
+    (add_shift, print_events, ...) are run by the daemon, without Python/Google startup.
+
+    Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
+    """
+    if stop:
+        if stop_daemon(rt.daemon_socket):
+            print("cliNRIS daemon stopped.")
+        else:
+            print("cliNRIS daemon is not running.")
+        return
+
+    rt.mirror_max_age = mirror_max_age
+    # Load credentials, calendar service and available calendars before the first client arrives
+    rt.calendar_choices()
+
+    server = CalendarDaemon(rt.daemon_socket)
+    print(f"cliNRIS daemon listening on {rt.daemon_socket} (stop with rt_daemon --stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
-import sys
-from src.Gcal_API import GoogleCalendarService
 import os
+import sys
+import click
 
 this_file = os.path.abspath(os.path.dirname(__file__))
 # scopes may have to be modifed, depending on your permissions for a given calender
@@ -23,30 +23,190 @@ rt_cal = "1.linje-vaktliste"
 # Default attendee for events & updating (email). Leave this as None for automatic setting the parameter
 attendee = None
 
+# Available calendars are cached in this file, and refreshed from Google when older than calendar_cache_ttl (seconds).
+# Use --refresh-calendars with any calendar CLI to refresh it now.
+calendar_cache = f"{this_file}/calendars.json"
+calendar_cache_ttl = 24 * 3600
+
+# Local mirror of calendar events (print_events answers from it, and only asks Google for changes):
+event_mirror = f"{this_file}/event_mirror.sqlite"
+use_mirror = True
+# Calendars print_events keeps in the mirror (the first sync downloads their full history, so only shift calendars):
+mirror_calendars = [rt_cal]
+# Seconds before the mirror is synced again in the same process (None: once per run). Set by rt_daemon.py.
+mirror_max_age = None
+
+# CLIs run in the cliNRIS daemon (rt_daemon.py) when it is running, skipping Python/Google startup:
+daemon_socket = f"{this_file}/clinris.sock"
+use_daemon = True
+
+# Requests to Google are rate limited (requests per second, adapted down when Google says slow down), with at most
+# max_concurrent_requests in flight. Rate limit and server errors are retried max_retries times with backoff.
+requests_per_second = 5.0
+max_concurrent_requests = 4
+max_retries = 5
+
+# 'Junk' calendars that are not available as calendar choices:
+junk_calendars = ["Holidays in Norway", "Week Numbers", "Birthdays"]
+
 ##########################################################################
-# If credentials and token are missing - abort!
-if not os.path.exists(secret_file) and not os.path.exists(token):
-    print(f"Could not find credentials/client_secret.json and token\n{secret_file}\n{token}")
-    sys.exit()
-
-# Contact calendar service to get available calenders:
-g_cal = GoogleCalendarService(scopes=scopes, credentialsfile=secret_file, token=token)
-avail_cal = g_cal.get_calendar_ids
-cal_choices = list(avail_cal.keys())
-
-
-# Remove 'junk' from available calendar choices_
-remove = ["Holidays in Norway", "Week Numbers", "Birthdays"]
-for junk in remove:
-    if junk in cal_choices:
-        cal_choices.remove(junk)
-
-# Guess default calendar and attendee if not set by user:
-if not default_cal or not attendee:
-    for cal in avail_cal.keys():
-        if "@" in cal:
-            if not default_cal:
-                default_cal = avail_cal[cal]
-            if not attendee:
-                attendee = cal
+# The calendar service is not contacted at import (--help and option errors stay offline).
+# It is created on first use and shared by everything in the process.
+_rt_calendar = None
+
+
+def get_calendar():
+    """
+    :return: RTCalendar shared by the whole process (created on first call)
+    """
+    global _rt_calendar
+    if _rt_calendar is None:
+        # If credentials and token are missing - abort!
+        if not os.path.exists(secret_file) and not token:
+            raise SystemExit(f"Could not find credentials/client_secret.json and token\n{secret_file}\n{token}")
+
+        from src.Gcal_profile import phase
+        with phase("import"):
+            from src.Gcal_API import RTCalendar
+            from src.Gcal_executor import RequestExecutor
+        executor = RequestExecutor(rate=requests_per_second, max_concurrency=max_concurrent_requests,
+                                   max_retries=max_retries)
+        _rt_calendar = RTCalendar(scopes=scopes, credentialsfile=secret_file, token=token,
+                                  calendar_cache=calendar_cache, cache_ttl=calendar_cache_ttl, executor=executor)
+    return _rt_calendar
+
+
+def calendar_choices():
+    """
+    :return: list with names (summary) of available calendars, without 'junk' calendars.
+    """
+    return [name for name in get_calendar().calendar_ids.keys() if name not in junk_calendars]
+
+
+def personal_calendar():
+    """
+    Guess the personal calendar of the user (calendar summary is the users email).
+    :return: str (calendar name) or None
+    """
+    for name in get_calendar().calendar_ids.keys():
+        if "@" in name:
+            return name
+    return None
+
+
+def get_default_cal():
+    """
+    :return: default calendar name (guess personal calendar if not set by user)
+    """
+    if default_cal:
+        return default_cal
+    return personal_calendar()
+
+
+def get_attendee():
+    """
+    :return: default attendee email (guess from personal calendar if not set by user)
+    """
+    if attendee:
+        return attendee
+    return personal_calendar()
+
+
+def open_calendar(cal=None, refresh_calendars=False):
+    """
+    Validates calendar name given to a CLI (after argument parsing) and returns the shared calendar set to it.
+    :param cal: str, calendar name (summary). None for default calendar.
+    :param refresh_calendars: bool, fetch available calendars from Google instead of the calendar cache.
+    :return: RTCalendar
+    """
+    rt_calendar = get_calendar()
+    if refresh_calendars:
+        rt_calendar.refresh_calendar_ids()
+    if not cal:
+        cal = get_default_cal()
+
+    choices = calendar_choices()
+    if cal not in choices and not refresh_calendars:
+        # Calendar may be new since the cache was written
+        rt_calendar.refresh_calendar_ids()
+        choices = calendar_choices()
+    if cal not in choices:
+        raise SystemExit(f"ABORTING: Found no calendar named {cal}.\nAvailable calendars: {', '.join(choices)}")
+
+    if rt_calendar.cal_name != cal:
+        rt_calendar.change_calendar(calendar_name=cal)
+    # Output settings of an earlier command in the daemon do not stick
+    rt_calendar.set_output()
+    return rt_calendar
+
+
+def resolve_event_id(rt_calendar, event_id=None, week=None, year=None, next_shift=False, attendee=None,
+                     institution=None):
+    """
+    Event ID given to a CLI, or found from week (year) / next shift in the shift index of the event mirror (only
+    for mirror_calendars, other calendars are asked for the week or future events, see RTCalendar.find_shift).
+    :param rt_calendar: RTCalendar (from open_calendar)
+    :param event_id: str
+    :param week: int, week number (as in the roster, see week_to_date)
+    :param year: int
+    :param next_shift: bool, next shift of attendee (default attendee if not given)
+    :param attendee: str, email
+    :param institution: str
+    :return: event id or None
+    """
+    if event_id:
+        return event_id
+    if not week and not next_shift:
+        return None
+
+    if rt_calendar.cal_name not in mirror_calendars:
+        # The first sync of a mirror downloads the calendar's full history
+        rt_calendar.mirror = None
+    elif not rt_calendar.mirror:
+        rt_calendar.use_mirror(event_mirror, max_age=mirror_max_age)
+    if next_shift and not attendee:
+        attendee = get_attendee()
+    return rt_calendar.find_shift(week=week, year=year, attendee=attendee, institution=institution)
+
+
+def start_profiling(ctx, param, value):
+    """
+    Click callback for --profile/--profile_stats (see profile_options).
+    """
+    if value:
+        from src.Gcal_profile import start_profiling
+        start_profiling(stats_file=value if isinstance(value, str) else None)
+
+
+def profile_options(main):
+    """
+    Adds --profile (trace Google API calls and time phases, summary printed at exit) and --profile_stats FILE
+    (also write cProfile stats to FILE) to a CLI.
+    """
+    main = click.option(
+        "--profile_stats", type=str, default=None, expose_value=False, is_eager=True, callback=start_profiling,
+        help="Profile (as --profile) and write cProfile stats to this file."
+    )(main)
+    return click.option(
+        "--profile", is_flag=True, default=False, expose_value=False, is_eager=True, callback=start_profiling,
+        help="Print Google API calls and time spent in each phase (token, build, fetch, render...)."
+    )(main)
+
+
+def run(main):
+    """
+    Run a CLI (click command main) in the cliNRIS daemon if it is running, otherwise in this process.
+    :param main: click command
+    """
+    if use_daemon and os.path.exists(daemon_socket):
+        from src.Gcal_daemon import run_in_daemon
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        code = run_in_daemon(daemon_socket, script, sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
 
+    from src.Gcal_profile import stop_profiling
+    try:
+        main()
+    finally:
+        stop_profiling()
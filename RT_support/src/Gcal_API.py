@@ -12,41 +12,149 @@ __email__ = "geir.isaksen@uit.no"
 __status__ = "Production"
 
 from datetime import datetime, timedelta, date
+from itertools import islice
+import csv
+import io
+import json
 import os.path
+import pickle
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from tabulate import tabulate
 import colorful as cf
-from .static_methods import cal_status_color, week_to_date
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+from .static_methods import cal_status_color, week_to_date, date_to_week, read_json_cache, write_json_cache, page, \
+    output_formats
+import googleapiclient
+try:
+    from googleapiclient.version import __version__ as client_version
+except ImportError:
+    client_version = getattr(googleapiclient, "__version__", "unknown")
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.errors import HttpError
+from .Gcal_executor import RequestExecutor, is_retryable
+from .Gcal_credentials import CredentialManager
+from .Gcal_profile import phase, timed
+from .RT_ics import events_to_ics
 
 
 cf.update_palette({"blue": "#2e54ff", "green": "#08a91e", "orange": "#ff5733"})
 
 main_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
+# Max number of calls in one batch HTTP request to the calendar API
+batch_limit = 50
+
+# Longest time (minutes) before an event the API accepts for a reminder
+max_reminder_minutes = 40320
+
+# Partial response selectors (fields=) for reading events, tailored to what each call site uses.
+# "full" (None) returns complete event resources, needed when a whole event body is written back.
+event_fields = {
+    "list": "id,summary,start,end,attendees(email,responseStatus)",
+    "swap": "id,etag,summary,start,end,attendees",
+    "respond": "id,etag,attendees",
+    "remind": "id,etag,summary,start,end,attendees(email,responseStatus)",
+    "summary": "id,etag,summary",
+    "full": None,
+}
+calendar_fields = "nextPageToken,items(id,summary)"
+
+
+def load_discovery_document(api="calendar", version="v3", cache_dir=f"{main_dir}/discovery_cache"):
+    """
+    Discovery document (API description) for api/version, parsed once and pickled in cache_dir.
+    The cache is keyed by the google-api-python-client version, so upgrading the library rebuilds it.
+    :param api: str
+    :param version: str
+    :param cache_dir: str (path)
+    :return: dict
+    """
+    cache_file = f"{cache_dir}/{api}_{version}_{client_version}.pickle"
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as cache:
+                return pickle.load(cache)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+
+    # Static document shipped with the library (google-api-python-client >= 2.0), otherwise fetch it once
+    document = None
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc(api, version)
+    except ImportError:
+        pass
+    if document:
+        document = json.loads(document)
+    else:
+        document = build(api, version, cache_discovery=False)._rootDesc
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as cache:
+            pickle.dump(document, cache)
+        os.replace(tmp_file, cache_file)
+    except OSError as err:
+        print(f"Could not write discovery cache {cache_file}: {err}")
+
+    return document
+
+
+def build_calendar_service(credentials, api="calendar", version="v3", cache_dir=f"{main_dir}/discovery_cache",
+                           http=None):
+    """
+    Build the calendar service from the cached discovery document (local work only).
+    :param credentials: google.oauth2.credentials.Credentials
+    :param http: http transport to use instead of credentials (e.g. Gcal_fake.FakeHttp)
+    :return: calendar (service) object
+    """
+    document = load_discovery_document(api=api, version=version, cache_dir=cache_dir)
+    return build_from_document(document, credentials=credentials, http=http)
+
 
 class GoogleCalendarService:
     """
     Creates service to communicate with Google calendar using credentials.
     """
     def __init__(self, scopes=None, credentialsfile=f'{main_dir}/client_secret.json',
-                 token=None):
+                 token=None, calendar_cache=f"{main_dir}/calendars.json", cache_ttl=24*3600,
+                 discovery_cache=f"{main_dir}/discovery_cache", executor=None, http=None):
         """
         :param scopes: Permissions (https://developers.google.com/identity/protocols/oauth2/scopes#calendar)
         :param credentials: Keys for accessing google api (client secret file)
         :param token: File that stores user's access and refresh tokens
+        :param calendar_cache: File caching available calendars {summary: id} (None disables disk cache)
+        :param cache_ttl: Seconds before calendar_cache is considered stale
+        :param discovery_cache: Directory caching the parsed discovery document for the calendar API
+        :param executor: RequestExecutor shared by all requests (rate limit and retries)
+        :param http: http transport for all requests instead of a connection to Google authorized with token
+        (e.g. Gcal_fake.FakeHttp for offline testing/benchmarks)
         """
 
         self.scopes = scopes
         self.credentialsfile = credentialsfile
         self.token = token
+        self.calendar_cache = calendar_cache
+        self.cache_ttl = cache_ttl
+        self.discovery_cache = discovery_cache
+        self.executor = executor or RequestExecutor()
+        self.http = http
+        self.credential_manager = None
         self.verify_args()
 
         self.credentials = self.validate_token()
         self.calendar = self.start_calender_service()
-        self.calendar_ids = self.get_calendar_ids
+
+        # Per-thread http transports (see thread_http)
+        self._local = threading.local()
+
+        # {summary: id} and {id: summary}, memoized in process (see calendar_ids)
+        self._calendar_ids = None
+        self._calendar_names = None
 
     def verify_args(self):
         """
@@ -61,38 +169,90 @@ class GoogleCalendarService:
         if not self.token:
             if os.path.isfile(f"{main_dir}/token.json"):
                 self.token = f"{main_dir}/token.json"
-                print(f"Found {self.token} (delete it if you can't connect.)")
+                print(f"Found {self.token} (delete it if you can't connect.)", file=sys.stderr)
             else:
-                print(f"No Token file specified. Creating {self.token} from credentials.")
+                print(f"No Token file specified. Creating {self.token} from credentials.", file=sys.stderr)
 
     def validate_token(self):
         """
-        :return: credentials
+        Credentials are read once per process and refreshed before they expire (see CredentialManager and execute).
+        :return: credentials (None with http transport given to the service)
         """
-        credentials = None
-        if self.token and os.path.exists(self.token):
-            credentials = Credentials.from_authorized_user_file(filename=self.token, scopes=self.scopes)
-        else:
-            print("No Token file. Generating from secret credential file....")
-
-        if not credentials or not credentials.valid:
-            if credentials and credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(self.credentialsfile, self.scopes)
-                credentials = flow.run_local_server(port=0)
-
-            with open(f"{main_dir}/token.json", "w") as token:
-                token.write(credentials.to_json())
-
-        return credentials
+        if self.http is not None:
+            return None
+        token = self.token or f"{main_dir}/token.json"
+        self.credential_manager = CredentialManager(token=token, credentialsfile=self.credentialsfile,
+                                                    scopes=self.scopes)
+        with phase("token"):
+            return self.credential_manager.get()
 
     def start_calender_service(self, api="calendar", version="v3"):
         """
-        Starts the google calendar service.
+        Starts the google calendar service (from cached discovery document, see build_calendar_service).
         :return: calendar (service) object
         """
-        return build(api, version, credentials=self.credentials)
+        with phase("build"):
+            return build_calendar_service(self.credentials, api=api, version=version, cache_dir=self.discovery_cache,
+                                          http=self.http)
+
+    def execute(self, request, http=None, tokens=1):
+        """
+        Execute request through the shared request executor (rate limit, retries with backoff). Credentials are
+        refreshed first if they are about to expire (the daemon keeps one service for hours).
+        :param request: HttpRequest or BatchHttpRequest
+        :param http: http transport (see thread_http)
+        :param tokens: int, requests in request (batch)
+        :return: response
+        """
+        if self.credential_manager is not None:
+            self.credential_manager.fresh(self.credentials)
+        return self.executor.execute(request, http=http, tokens=tokens)
+
+    def execute_batch(self, requests, batch_size=batch_limit):
+        """
+        Execute requests in batch HTTP requests (batch_size requests in each). Requests failing with rate limit or
+        server errors are retried in new batches after a backoff, only those. Other errors are returned.
+        :param requests: dict {key: function returning HttpRequest} (a function, since retries need new requests)
+        :param batch_size: int, requests per batch (max batch_limit)
+        :return: dict {key: (response, error)} (response is None if failed, error is None if successful)
+        """
+        batch_size = max(1, min(batch_size, batch_limit))
+        keys = {str(key): key for key in requests.keys()}
+        results = dict()
+
+        def collect(request_id, response, exception):
+            results[keys[request_id]] = (response, exception)
+
+        pending = list(requests.keys())
+        with phase("batch"):
+            for attempt in range(self.executor.max_retries + 1):
+                for start in range(0, len(pending), batch_size):
+                    chunk = pending[start:start + batch_size]
+                    batch = self.calendar.new_batch_http_request(callback=collect)
+                    for key in chunk:
+                        batch.add(requests[key](), request_id=str(key))
+                    self.execute(batch, tokens=len(chunk))
+
+                failed = [key for key in pending if is_retryable(results[key][1])]
+                if not failed or attempt == self.executor.max_retries:
+                    break
+                print(cf.orange(f"Retrying {len(failed)} failed request(s)..."), file=sys.stderr)
+                self.executor.backoff(attempt, results[failed[0]][1])
+                pending = failed
+
+        return results
+
+    def thread_http(self):
+        """
+        Authorized http transport for the current thread. httplib2 is not thread-safe, so requests executed in
+        worker threads must use their own transport: request.execute(http=self.thread_http()).
+        :return: google_auth_httplib2.AuthorizedHttp
+        """
+        if self.http is not None:
+            return self.http
+        if not hasattr(self._local, "http"):
+            self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
 
     def print_avail_calendars(self):
         """
@@ -109,18 +269,71 @@ class GoogleCalendarService:
     @property
     def get_all_calendars(self):
         """
-        :return: list of calendars that user has access to.
+        :return: list of calendars (id and summary) that user has access to.
         """
-        return self.calendar.calendarList().list().execute().get('items', [])
+        calendars = list()
+        page_token = None
+        while True:
+            with phase("calendars"):
+                page = self.execute(self.calendar.calendarList().list(fields=calendar_fields, pageToken=page_token))
+            calendars += page.get('items', [])
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return calendars
 
     @property
     def get_calendar_ids(self):
         """
         :return: dict {summary:id}
         """
+        return self.calendar_ids
+
+    @property
+    def calendar_ids(self):
+        """
+        Available calendars. Memoized in process, and read from calendar_cache (if not older than cache_ttl)
+        before asking Google.
+        :return: dict {summary:id}
+        """
+        if self._calendar_ids is None and self.calendar_cache:
+            self.set_calendar_ids(read_json_cache(self.calendar_cache, ttl=self.cache_ttl))
+        if self._calendar_ids is None:
+            self.refresh_calendar_ids()
+        return self._calendar_ids
+
+    @property
+    def calendar_names(self):
+        """
+        :return: dict {id:summary}
+        """
+        if self._calendar_names is None:
+            self.set_calendar_ids(self.calendar_ids)
+        return self._calendar_names
+
+    def set_calendar_ids(self, cal_ids):
+        """
+        :param cal_ids: dict {summary:id} or None (forget memoized calendars)
+        """
+        self._calendar_ids = cal_ids
+        self._calendar_names = None
+        if cal_ids is not None:
+            self._calendar_names = {cal_id: name for name, cal_id in cal_ids.items()}
+
+    def refresh_calendar_ids(self):
+        """
+        Fetch available calendars from Google and update calendar_cache.
+        :return: dict {summary:id}
+        """
         cal_ids = dict()
         for cal in self.get_all_calendars:
             cal_ids[cal["summary"]] = cal["id"]
+        self.set_calendar_ids(cal_ids)
+
+        if self.calendar_cache:
+            try:
+                write_json_cache(self.calendar_cache, cal_ids)
+            except OSError as err:
+                print(f"Could not write calendar cache {self.calendar_cache}: {err}", file=sys.stderr)
         return cal_ids
 
 
@@ -129,14 +342,39 @@ class MyCalendar(GoogleCalendarService):
     Subclass of GoogleCalendarService whith focus on one selected calender from the available ones.
     """
     def __init__(self, calendar_id, scopes, credentialsfile=f'{main_dir}/client_secret.json',
-                 token=f"{main_dir}/token.json"):
-        super(MyCalendar, self).__init__(scopes=scopes, credentialsfile=credentialsfile, token=token)
+                 token=f"{main_dir}/token.json", **kwargs):
+        super(MyCalendar, self).__init__(scopes=scopes, credentialsfile=credentialsfile, token=token, **kwargs)
 
         self.id = calendar_id
         self.cal_name = self.current_calendar
 
         # future events in myCalendar to print out:
         self.maxResults = 999
+        # events per page in events().list requests (API max is 2500)
+        self.page_size = 250
+        # Local mirror of events (see use_mirror)
+        self.mirror = None
+
+    def use_mirror(self, filename, max_age=None):
+        """
+        Answer event listings from a local mirror (SQLite file), synced incrementally with Google once per run
+        (or when older than max_age seconds, for long running processes).
+        :param filename: str (path) to mirror file
+        :param max_age: float, seconds
+        """
+        if self.mirror and self.mirror.filename == filename:
+            self.mirror.max_age = max_age
+            return
+        from .Gcal_mirror import EventMirror
+        self.mirror = EventMirror(filename, max_age=max_age)
+
+    def mirror_changed(self):
+        """
+        Events of this calendar were changed by us: the mirror must sync before it answers again (even within
+        mirror max_age in the daemon), so that deleted or swapped shifts are not found.
+        """
+        if self.mirror:
+            self.mirror.expire(self.id)
 
     def change_calendar(self, calendar_name=None, calendar_id=None):
         """
@@ -146,7 +384,7 @@ class MyCalendar(GoogleCalendarService):
         :return:
         """
         if not calendar_id and not calendar_name:
-            print("Need calendar name or ID to swap.")
+            print("Need calendar name or ID to swap.", file=sys.stderr)
             return
 
         if calendar_name:
@@ -154,65 +392,122 @@ class MyCalendar(GoogleCalendarService):
                 self.id = self.calendar_ids[calendar_name]
                 self.cal_name = calendar_name
             except KeyError:
-                print(f"Found no calendar named {calendar_name}")
+                print(f"Found no calendar named {calendar_name}", file=sys.stderr)
                 return
         elif calendar_id:
             self.id = calendar_id
             self.cal_name = self.current_calendar
 
-        print(f"Swapped to calender ID {self.id}")
+        print(f"Swapped to calender ID {self.id}", file=sys.stderr)
 
     @property
     def current_calendar(self):
-        for name in self.calendar_ids.keys():
-            if self.calendar_ids[name] == self.id:
-                return name
-        return None
+        return self.calendar_names.get(self.id)
+
+    def iter_events(self, page_size=None, fields=event_fields["list"], calendar_id=None, http=None, **kwargs):
+        """
+        Generator over events in calendar, following nextPageToken. Only one page is kept in memory, and
+        events are yielded as soon as their page arrives.
+        :param page_size: int, events per request (default: self.page_size)
+        :param fields: str, fields to return for each event (see event_fields). None for full events.
+        :param calendar_id: str, calendar to list (default: self.id)
+        :param http: http transport to execute requests with (default: the service's own)
+        :param kwargs: extra arguments to events().list (timeMin, timeMax, ...)
+        :return: generator with events
+        """
+        if fields:
+            fields = f"nextPageToken,items({fields})"
+
+        page_token = None
+        while True:
+            with phase("fetch"):
+                page = self.execute(self.calendar.events().list(
+                    calendarId=calendar_id or self.id,
+                    maxResults=page_size or self.page_size, singleEvents=True,
+                    orderBy="startTime", pageToken=page_token, fields=fields, **kwargs
+                ), http=http)
+
+            yield from page.get("items", [])
+
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return
 
     @property
     def get_future_events(self):
         """
-        :return:
+        :return: generator with (max self.maxResults) future events
         """
-        _from = datetime.utcnow().isoformat() + 'Z'
-
-        events = self.calendar.events().list(
-            calendarId=self.id,
-            timeMin=_from,
-            maxResults=self.maxResults, singleEvents=True,
-            orderBy="startTime",
-        ).execute()
+        if self.mirror:
+            self.mirror.sync(self)
+            return islice(self.mirror.events(self.id, from_date=datetime.utcnow().date()), self.maxResults)
 
-        return events.get("items", [])
+        _from = datetime.utcnow().isoformat() + 'Z'
+        page_size = min(self.page_size, self.maxResults)
+        return islice(self.iter_events(page_size=page_size, timeMin=_from), self.maxResults)
 
-    def get_events(self, from_date, to_date):
+    def get_events(self, from_date, to_date, page_size=None, fields=event_fields["list"]):
         """
         :param from_date: year-month-day
         :param to_date:  year-mont-day
-        :return: events
+        :param page_size: int, events per request (default: self.page_size)
+        :param fields: str, fields to return for each event (see event_fields). None for full events.
+        :return: generator with events
         """
-        events = self.calendar.events().list(
-            calendarId=self.id,
-            timeMin=f"{from_date}T00:00:00Z",
-            timeMax=f"{to_date}T23:59:59Z",
-            maxResults=self.maxResults, singleEvents=True,
-            orderBy="startTime",
-        ).execute()
+        if self.mirror and fields == event_fields["list"]:
+            self.mirror.sync(self)
+            return self.mirror.events(self.id, from_date=from_date, to_date=to_date)
 
-        return events.get("items", [])
+        return self.iter_events(page_size=page_size, fields=fields, timeMin=f"{from_date}T00:00:00Z",
+                                timeMax=f"{to_date}T23:59:59Z")
 
-    def get_event(self, event_id):
+    def get_event(self, event_id, fields=event_fields["full"]):
         """
         Get body of a given event (id)
         :param event_id: id of event
+        :param fields: str, fields to return (see event_fields). None (default) for the full event body, which
+        is needed when the event is written back with update_event.
         :return: body
         """
-        return self.calendar.events().get(calendarId=self.id, eventId=event_id).execute()
+        with phase("fetch"):
+            return self.execute(self.calendar.events().get(calendarId=self.id, eventId=event_id, fields=fields))
 
-    def events_ahead(self, weeks=None):
+    def get_events_calendars(self, calendar_names, from_date, to_date, workers=8):
+        """
+        Events from several calendars in the same period, fetched concurrently by a pool of max workers threads
+        (each with its own http transport).
+        :param calendar_names: list with calendar names (summary)
+        :param from_date: year-month-day
+        :param to_date: year-month-day
+        :param workers: int, max concurrent requests
+        :return: list with events from all calendars sorted by start (calendar name in event["calendar"])
+        """
+        def calendar_events(name):
+            events = list(self.iter_events(calendar_id=self.calendar_ids[name], http=self.thread_http(),
+                                           timeMin=f"{from_date}T00:00:00Z", timeMax=f"{to_date}T23:59:59Z"))
+            for event in events:
+                event["calendar"] = name
+            return events
+
+        events = list()
+        with phase("fetch"), ThreadPoolExecutor(max_workers=max(1, min(workers, len(calendar_names)))) as pool:
+            for calendar_events_ in pool.map(calendar_events, calendar_names):
+                events += calendar_events_
+
+        return sorted(events, key=lambda event: event["start"].get("dateTime", event["start"].get("date")))
+
+    @staticmethod
+    def period_ahead(weeks=None):
+        """
+        :param weeks: str, today, week, month or year
+        :return: from date, to date (year-month-day)
+        """
         today = datetime.now().date()
         weeks_ahead = {"today": 0, "week": 1, "month": 4, "year": 52}
-        return self.get_events(str(today), str(today + timedelta(weeks=weeks_ahead[weeks])))
+        return str(today), str(today + timedelta(weeks=weeks_ahead[weeks]))
+
+    def events_ahead(self, weeks=None):
+        return self.get_events(*self.period_ahead(weeks=weeks))
 
     def set_maxresults(self, n=100):
         """
@@ -224,23 +519,51 @@ class MyCalendar(GoogleCalendarService):
         except ValueError:
             print(f"Expected integer in set_maxrestuls. Got {type(n)}.")
 
+    def set_page_size(self, n=250):
+        """
+        :param n: Events per request when listing events (default=250, max 2500)
+        """
+        try:
+            self.page_size = max(1, min(int(n), 2500))
+        except ValueError:
+            print(f"Expected integer in set_page_size. Got {type(n)}.")
+
     def add_event(self, body):
-        return self.calendar.events().insert(calendarId=self.id, body=body, sendNotifications=True,
-                                             sendUpdates="all").execute()
+        event = self.execute(self.calendar.events().insert(calendarId=self.id, body=body, sendNotifications=True,
+                                                           sendUpdates="all"))
+        self.mirror_changed()
+        return event
 
-    def respond_event(self, event_id, attendee, response):
-        event = self.get_event(event_id)
-        found_attendee = False
-        for i in range(len(event["attendees"])):
-            if event["attendees"][i]["email"] == attendee:
-                event["attendees"][i]["responseStatus"] = response
-                found_attendee = True
-        if not found_attendee:
-            print(f"Could not find attendee {attendee} in event ID {event_id}")
-            return
+    def add_events(self, bodies, batch_size=batch_limit):
+        """
+        Insert several events using batch HTTP requests (batch_size events per request, see execute_batch).
+        :param bodies: list with event bodies
+        :param batch_size: int, events per batch request (max batch_limit)
+        :return: list with (event, error) for each body (event is None if failed, error is None if inserted)
+        """
+        def insert(body):
+            return lambda: self.calendar.events().insert(calendarId=self.id, body=body, sendNotifications=True,
+                                                         sendUpdates="all")
+
+        results = self.execute_batch({i: insert(body) for i, body in enumerate(bodies)}, batch_size=batch_size)
+        self.mirror_changed()
+        return [results[i] for i in range(len(bodies))]
 
-        self.update_event(body=event, event_id=event_id)
-        print(cf.blue(f"{attendee} status set to: {response}\n"))
+    def respond_event(self, event_id, attendee, response):
+        def set_response(event):
+            attendees = event.get("attendees", [])
+            found_attendee = False
+            for who in attendees:
+                if who.get("email") == attendee:
+                    who["responseStatus"] = response
+                    found_attendee = True
+            if not found_attendee:
+                print(f"Could not find attendee {attendee} in event ID {event_id}")
+                return None
+            return {"attendees": attendees}
+
+        if self.patch_event(event_id, set_response, fields=event_fields["respond"]):
+            print(cf.blue(f"{attendee} status set to: {response}\n"))
 
     def add_attendee(self, event_id, attendee):
         """
@@ -250,85 +573,214 @@ class MyCalendar(GoogleCalendarService):
             print(f"{attendee} does not seem to be a valid email address.")
             return
 
-        event = self.get_event(event_id)
-        event["attendees"].append({"email": attendee})
+        def append_attendee(event):
+            return {"attendees": event.get("attendees", []) + [{"email": attendee}]}
 
-        self.update_event(body=event, event_id=event_id)
+        self.patch_event(event_id, append_attendee, fields=event_fields["respond"])
 
     def remove_attendee(self, event_id, attendee):
         """
         Deletes/removes attendee from event
         """
-        event = self.get_event(event_id)
-        for i in range(len(event["attendees"])):
-            if event["attendees"][i]["email"] == attendee:
-                del event["attendees"][i]
-        self.update_event(body=event, event_id=event_id)
+        def drop_attendee(event):
+            return {"attendees": [who for who in event.get("attendees", []) if who.get("email") != attendee]}
+
+        self.patch_event(event_id, drop_attendee, fields=event_fields["respond"])
 
     def replace_attendee(self, event_id, attendee_old, attendee_new):
         """
         replace existing attendee with new attendee
         """
-        event = self.get_event(event_id)
-        found_attendee = False
-        for i in range(len(event["attendees"])):
-            if event["attendees"][i]["email"] == attendee_old:
-                event["attendees"][i]["email"] = attendee_new
-                found_attendee = True
-        if not found_attendee:
-            print(f"Could not find attendee {attendee_old} in event ID {event_id}")
-            return
-
-        self.update_event(body=event, event_id=event_id)
+        def swap_attendee(event):
+            attendees = event.get("attendees", [])
+            found_attendee = False
+            for i in range(len(attendees)):
+                if attendees[i].get("email") == attendee_old:
+                    attendees[i]["email"] = attendee_new
+                    found_attendee = True
+            if not found_attendee:
+                print(f"Could not find attendee {attendee_old} in event ID {event_id}")
+                return None
+            return {"attendees": attendees}
+
+        self.patch_event(event_id, swap_attendee, fields=event_fields["respond"])
 
     def add_to_summary(self, event_id, new_text=""):
-        event = self.get_event(event_id)
-        event["summary"] += new_text
-        self.update_event(body=event, event_id=event_id)
+        self.patch_event(event_id, lambda event: {"summary": event.get("summary", "") + new_text},
+                         fields=event_fields["summary"])
 
     def replace_summary(self, event_id, new_text=""):
-        event = self.get_event(event_id)
-        event["summary"] = new_text
-        self.update_event(body=event, event_id=event_id)
+        # Overwrites summary regardless of current value, so no need to read the event first.
+        self.patch_event(event_id, body={"summary": new_text})
 
     def delete_summary(self, event_id):
         self.replace_summary(event_id=event_id, new_text="")
 
-    def remind_event(self, event_id):
+    @staticmethod
+    def reminder_minutes(event):
         """
-        Send email notification to attendee(s) in event ID
-        :param event_id:
+        :param event: event with start (all-day)
+        :return: int, minutes from now until the day before event starts (email reminder now)
         """
-        event = self.get_event(event_id).copy()
         event_starts = datetime.strptime((event["start"]["date"]), '%Y-%m-%d').date()
         today = datetime.today().date()
-        print(event_starts)
-        print(today)
 
         days = (event_starts - today).days - 1
-        minutes = (days * 24 * 60) + ((23 - datetime.now().hour)*60) + (59 - datetime.now().minute)
-
-        event['reminders'] = {
-            'useDefault': False,
-             'overrides': [
-                {'method': 'email', 'minutes': minutes},
-                {'method': 'popup', 'minutes': 10},
-             ],
+        return (days * 24 * 60) + ((23 - datetime.now().hour)*60) + (59 - datetime.now().minute)
+
+    @staticmethod
+    def reminder_body(event):
+        """
+        Reminders (patch body) sending an email to attendees now, i.e. minutes from now until event starts.
+        :param event: event with start
+        :return: dict
+        """
+        minutes = MyCalendar.reminder_minutes(event)
+
+        return {
+            'reminders': {
+                'useDefault': False,
+                'overrides': [
+                    {'method': 'email', 'minutes': minutes},
+                    {'method': 'popup', 'minutes': 10},
+                ],
+            }
         }
-        self.update_event(body=event, event_id=event_id)
+
+    def remind_event(self, event_id):
+        """
+        Send email notification to attendee(s) in event ID
+        :param event_id:
+        """
+        reminded = dict()
+
+        def set_reminder(event):
+            reminded.update(event)
+            return self.reminder_body(event)
+
+        if not self.patch_event(event_id, set_reminder, fields=event_fields["remind"]):
+            return
         emails = list()
-        for who in event["attendees"]:
+        for who in reminded.get("attendees", []):
             emails.append(who["email"])
         print(f"Email reminder sent to {', '.join(emails)}.")
 
+    def remind_unconfirmed(self, weeks=4):
+        """
+        Send email notification to attendees in all events the next weeks where someone has not responded
+        (needsAction). Events are listed once, and reminders are set with one batch of patches.
+        :param weeks: int, weeks ahead to look for events
+        :return: list with reminded events
+        """
+        today = datetime.now().date()
+        unconfirmed = list()
+        too_far = list()
+        for event in self.get_events(str(today), str(today + timedelta(weeks=weeks)), fields=event_fields["remind"]):
+            # Only all-day events (shifts) that have not started yet
+            if "date" not in event["start"] or date.fromisoformat(event["start"]["date"]) <= today:
+                continue
+            if any(who.get("responseStatus", "needsAction") == "needsAction" for who in event.get("attendees", [])):
+                if self.reminder_minutes(event) > max_reminder_minutes:
+                    too_far.append(event)
+                else:
+                    unconfirmed.append(event)
+
+        if too_far:
+            print(cf.orange(f"Skipping {len(too_far)} event(s) too far ahead for a reminder now (Google allows at most "
+                            f"{max_reminder_minutes // 1440} days before the event): "
+                            f"{', '.join(event.get('summary', event['id']) for event in too_far)}"))
+        if not unconfirmed:
+            print(cf.green(f"All attendees have responded to events the next {weeks} weeks in {self.cal_name}."))
+            return unconfirmed
+
+        results = self.patch_events(unconfirmed, [self.reminder_body(event) for event in unconfirmed])
+
+        headers = map(cf.blue, ["Week", "Summary", "Not responded", "Reminder sent to"])
+        table = list()
+        reminded = list()
+        for i, event in enumerate(unconfirmed):
+            week = date_to_week(date.fromisoformat(event["start"]["date"]))[1]
+            waiting = [who["email"] for who in event.get("attendees", [])
+                       if who.get("responseStatus", "needsAction") == "needsAction"]
+            error = results[i][1]
+            if error is None:
+                sent = cf.green(", ".join(who["email"] for who in event.get("attendees", [])))
+                reminded.append(event)
+            else:
+                sent = cf.red(f"failed: {error}")
+            table.append([week, event.get("summary", ""), cf.orange("\n".join(waiting)), sent])
+        print(tabulate(table, headers, tablefmt="pretty", stralign="left"))
+        print(f"Email reminder sent for {len(reminded)} of {len(unconfirmed)} events.")
+        return reminded
+
+    def patch_event(self, event_id, change=None, fields=event_fields["respond"], body=None, retries=3):
+        """
+        Patch event with a minimal body. With change, the current event is read (only fields) and the patch is
+        conditional on its ETag (If-Match), so that edits made by others in the meantime are not lost. If the
+        event changed (412 Precondition Failed), it is read again and change is re-applied.
+        :param event_id: id of event
+        :param change: function(event) -> patch body (dict), or None to cancel the edit
+        :param fields: str, fields of the event needed by change (must include etag, see event_fields)
+        :param body: dict, patch body written as is (without reading the event) when change is not given
+        :param retries: int, re-reads after 412 before giving up
+        :return: updated event (id, etag, updated) or None if cancelled
+        """
+        for attempt in range(retries + 1):
+            etag = None
+            if change:
+                event = self.get_event(event_id, fields=fields)
+                etag = event.get("etag")
+                body = change(event)
+                if body is None:
+                    return None
+
+            request = self.calendar.events().patch(calendarId=self.id, eventId=event_id, body=body,
+                                                   sendUpdates="all", fields="id,etag,updated")
+            if etag:
+                request.headers["If-Match"] = etag
+            try:
+                event_updated = self.execute(request)
+            except HttpError as err:
+                if err.resp.status == 412 and change and attempt < retries:
+                    print(cf.orange(f"Event {event_id} was changed by someone else. Retrying..."))
+                    continue
+                raise
+
+            self.mirror_changed()
+            print(f"\nEvent {event_id} updated {event_updated['updated']}")
+            return event_updated
+
+    def patch_events(self, events, changes):
+        """
+        Patch several events in one batch, each conditional on its ETag (If-Match).
+        :param events: list with events (id, etag)
+        :param changes: list with patch bodies, one for each event
+        :return: dict {index: (response, error)}
+        """
+        def patch(event, change):
+            def request():
+                req = self.calendar.events().patch(calendarId=self.id, eventId=event["id"], body=change,
+                                                   sendUpdates="all", fields="id,etag,updated")
+                if event.get("etag"):
+                    req.headers["If-Match"] = event["etag"]
+                return req
+            return request
+
+        results = self.execute_batch({i: patch(event, change) for i, (event, change) in
+                                      enumerate(zip(events, changes))})
+        self.mirror_changed()
+        return results
+
     def update_event(self, body, event_id):
-        event_updated = self.calendar.events().update(calendarId=self.id, eventId=event_id, body=body,
-                                                      sendUpdates="all").execute()
+        event_updated = self.execute(self.calendar.events().update(calendarId=self.id, eventId=event_id, body=body,
+                                                                   sendUpdates="all"))
+        self.mirror_changed()
 
         print(f"\nEvent {event_id} updated {event_updated['updated']}")
 
     def delete_event(self, event_id):
-        resp = self.calendar.events().delete(calendarId=self.id, eventId=event_id, sendUpdates="all").execute()
+        resp = self.execute(self.calendar.events().delete(calendarId=self.id, eventId=event_id, sendUpdates="all"))
+        self.mirror_changed()
         if len(resp) == 0:
             print(f"Successfully deleted event ID {event_id}")
         else:
@@ -339,14 +791,87 @@ class RTCalendar(MyCalendar):
     """
     Custom calendar class (MyCalendar) for Metacenter RT support events and rosters.
     """
-    def __init__(self, calendar_id=None, scopes=None, credentialsfile='client_secret.json', token="token.json"):
+    def __init__(self, calendar_id=None, scopes=None, credentialsfile='client_secret.json', token="token.json",
+                 **kwargs):
         if not scopes:
             scopes = ['https://www.googleapis.com/auth/calendar']
         if not calendar_id:
             calendar_id = "metacenter.no_6e66i3ok59rbrecrg5ck1d5b2o@group.calendar.google.com"
 
         super(RTCalendar, self).__init__(calendar_id=calendar_id, scopes=scopes, credentialsfile=credentialsfile,
-                                         token=token)
+                                         token=token, **kwargs)
+
+        # How events are printed (see set_output)
+        self.output = "grid"
+        self.color = None
+        self.pager = False
+
+    def find_shift(self, week=None, year=None, attendee=None, institution=None):
+        """
+        Event ID of the RT shift in week (year), or of the next shift (of attendee) if no week is given.
+        Looked up in the shift index of the event mirror (see use_mirror), not with extra API calls. Calendars
+        without mirror are asked for the week (or future events) instead (see list_shifts).
+        :param week: int, week number (as in shift_body, see week_to_date)
+        :param year: int (default: this year)
+        :param attendee: str, email of attendee in shift
+        :param institution: str, UiT, NTNU, etc...
+        :return: event id, or None if no (or more than one) shift matches
+        """
+        if self.mirror:
+            self.mirror.sync(self)
+
+            def find_shifts(**kwargs):
+                return self.mirror.find_shifts(self.id, **kwargs)
+        else:
+            find_shifts = self.list_shifts
+
+        if week:
+            if not year:
+                year = datetime.now().year
+            what = f"week {week} ({year})"
+            shifts = list(find_shifts(week_start=week_to_date(year, week)[0], email=attendee,
+                                      institution=institution))
+        else:
+            what = "the future"
+            shifts = list(islice(find_shifts(email=attendee, institution=institution,
+                                             from_date=datetime.now().date()), 1))
+        if attendee:
+            what += f" for {attendee}"
+
+        if not shifts:
+            print(f"Found no shift in {what} in {self.cal_name}.")
+            return None
+        if len(shifts) > 1:
+            print(cf.red(f"Found {len(shifts)} shifts in {what}. Use event ID, institution or attendee to choose:"))
+            self.print_rt_events(shifts)
+            return None
+        return shifts[0]["id"]
+
+    def list_shifts(self, week_start=None, email=None, institution=None, from_date=None):
+        """
+        Shifts as in EventMirror.find_shifts, listed from Google (for calendars that are not mirrored).
+        :param week_start: date, only shifts starting this day or the next 6 days
+        :param email: str, attendee in shift
+        :param institution: str, institution in shift summary (case insensitive)
+        :param from_date: date, only shifts ending after this day
+        :return: generator with events, ordered by start
+        """
+        if week_start:
+            events = self.iter_events(timeMin=f"{week_start}T00:00:00Z",
+                                      timeMax=f"{week_start + timedelta(days=7)}T00:00:00Z")
+        else:
+            events = self.iter_events(timeMin=f"{from_date}T00:00:00Z")
+
+        for event in events:
+            start_day = event["start"].get("date", event["start"].get("dateTime", ""))[:10]
+            if week_start and not str(week_start) <= start_day < str(week_start + timedelta(days=7)):
+                continue
+            if email is not None and email not in [who.get("email") for who in event.get("attendees", [])]:
+                continue
+            if institution and (":" not in event.get("summary", "") or
+                                event["summary"].split(":")[0].strip().lower() != institution.lower()):
+                continue
+            yield event
 
     def print_future_events(self, max_results=None):
         if max_results:
@@ -355,7 +880,7 @@ class RTCalendar(MyCalendar):
         self.print_rt_events(events)
 
     def get_print_events(self, when="today"):
-        print(cf.blue(f"* Events {when} in {self.cal_name} *"))
+        self.print_heading(f"* Events {when} in {self.cal_name} *")
         self.print_rt_events(self.events_ahead(weeks=when))
 
     def get_print_weeks(self, week1, year1, week2, year2):
@@ -363,58 +888,189 @@ class RTCalendar(MyCalendar):
             week2 = week1
         day1 = week_to_date(year=year1, week=week1)[0]
         day2 = week_to_date(year=year2, week=week2)[0]
-        print(cf.blue(f"* Events in weeks {week1} ({year1}) - {week2} ({year2}) in {self.cal_name} *"))
+        self.print_heading(f"* Events in weeks {week1} ({year1}) - {week2} ({year2}) in {self.cal_name} *")
         self.print_rt_events(self.get_events(from_date=day1, to_date=day2))
 
-    def print_rt_events(self, events):
+    def get_print_calendars(self, calendar_names, when="today", week1=None, year1=None, week2=None, year2=None,
+                            workers=8):
         """
-        :param max_results:
-        :return:
+        Print events from several calendars in one table, either when (today, week...) or week1 - week2.
         """
-        headers = map(cf.blue, ["Week", "From / To", "Summary", "Attendees", "Status", "Event id"])
+        if week1:
+            if not week2:
+                week2 = week1
+            day1 = week_to_date(year=year1, week=week1)[0]
+            day2 = week_to_date(year=year2, week=week2)[0]
+            self.print_heading(f"* Events in weeks {week1} ({year1}) - {week2} ({year2}) in "
+                               f"{', '.join(calendar_names)} *")
+        else:
+            day1, day2 = self.period_ahead(weeks=when)
+            self.print_heading(f"* Events {when} in {', '.join(calendar_names)} *")
 
-        table = list()
-        for event in events:
-            needs_attention = False
-            status = ""
-            email = ""
-            if "attendees" in event.keys():
-                for i in range(len(event["attendees"])):
-
-                    who = event["attendees"][i]
-                    nl = ""
-                    if i < (len(event["attendees"]) - 1):
-                        nl = "\n"
-
-                    try:
-                        email += who["email"] + nl
-                    except KeyError:
-                        email += "no@mail.given" + nl
-                        pass
-                    try:
-                        status += f"{cal_status_color(who['responseStatus'])}{nl}"
-
-                    except KeyError:
-                        status += "needsAction" + nl
-                        pass
-            else:
-                status += "Who knows..."
-                email += "no@email.given"
-                needs_attention = True
+        self.print_rt_events(self.get_events_calendars(calendar_names, day1, day2, workers=workers),
+                             show_calendar=True)
+
+    def set_output(self, output="grid", color=None, pager=False):
+        """
+        How print_rt_events prints events.
+        :param output: str, one of output_formats (grid is for humans, the others for other tools)
+        :param color: bool, colored grid (None: only if printing to a terminal)
+        :param pager: bool, page the grid with $PAGER (less) when printing to a terminal
+        """
+        if output not in output_formats:
+            raise SystemExit(f"ABORTING: Unknown output format {output}. Use one of {', '.join(output_formats)}.")
+        self.output = output
+        self.color = color
+        self.pager = pager
+
+    def print_heading(self, text):
+        """
+        Heading above the grid of events (machine readable output has no heading).
+        """
+        if self.output == "grid":
+            print(cf.blue(text) if self.use_color else text)
 
-            summary = event["summary"]
-            id = event["id"]
-            starts = event['start'].get('dateTime', event['start'].get('date'))
-            ends = event['end'].get('dateTime', event['end'].get('date'))
+    @property
+    def use_color(self):
+        if self.output != "grid":
+            return False
+        if self.color is None:
+            return sys.stdout.isatty()
+        return self.color
+
+    @staticmethod
+    def event_record(event, show_calendar=False):
+        """
+        :param event: dict (event)
+        :param show_calendar: bool, include event["calendar"] (see get_events_calendars)
+        :return: dict with the printed fields of event
+        """
+        starts = event['start'].get('dateTime', event['start'].get('date'))
+        ends = event['end'].get('dateTime', event['end'].get('date'))
+        record = {
+            "week": date_to_week(date.fromisoformat(starts[:10]))[1],
+            "end_week": date_to_week(date.fromisoformat(ends[:10]))[1],
+            "start": starts,
+            "end": ends,
+            "summary": event.get("summary", ""),
+            "attendees": [{"email": who.get("email", "no@mail.given"),
+                           "responseStatus": who.get("responseStatus", "needsAction")}
+                          for who in event.get("attendees", [])],
+            "id": event["id"],
+        }
+        if show_calendar:
+            record["calendar"] = event.get("calendar", "")
+        return record
+
+    def format_rt_events(self, events, rows_per_table=None, show_calendar=False):
+        """
+        Events formatted as self.output, as a generator of text that is produced while events arrive: one line
+        per event (jsonl, csv, tsv and json), one VEVENT per event (ics) or one table per rows_per_table events
+        (grid and plain).
+        :param events: iterable with events (e.g. generator from get_events)
+        :param rows_per_table: int (default: self.page_size)
+        :param show_calendar: bool, add calendar of events (see get_events_calendars)
+        :return: generator with str
+        """
+        if self.output == "ics":
+            yield from events_to_ics(events, name=self.cal_name)
+            return
 
-            w1 = date(*map(int, starts.split("T")[0].split("-")[0:3])).isocalendar()[1]
-            w2 = date(*map(int, ends.split("T")[0].split("-")[0:3])).isocalendar()[1]
+        records = (self.event_record(event, show_calendar=show_calendar) for event in events)
+
+        if self.output in ("json", "jsonl"):
+            first = True
+            for record in records:
+                if self.output == "jsonl":
+                    yield json.dumps(record) + "\n"
+                else:
+                    yield ("[\n" if first else ",\n") + json.dumps(record)
+                first = False
+            if self.output == "json":
+                yield "[]\n" if first else "\n]\n"
+            return
 
-            table.append([f"{w1}\n{w2}", f"{starts}\n{ends}", summary, email, status, id])
-            if needs_attention:
-                table[-1][-3:-1] = map(cf.red, table[-1][-3:-1])
+        columns = ["week", "end_week", "start", "end", "summary", "attendees", "status", "id"]
+        if show_calendar:
+            columns.insert(4, "calendar")
+
+        if self.output in ("csv", "tsv"):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter="," if self.output == "csv" else "\t", lineterminator="\n")
+            writer.writerow(columns)
+            for record in records:
+                record["status"] = ";".join(who["responseStatus"] for who in record["attendees"])
+                record["attendees"] = ";".join(who["email"] for who in record["attendees"])
+                writer.writerow([record[column] for column in columns])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+            return
 
-        print(tabulate(table, headers, tablefmt="fancy_grid", stralign="left"))
+        # grid and plain: tables of rows_per_table events
+        color = self.use_color
+        headers = ["Week", "From / To", "Summary", "Attendees", "Status", "Event id"]
+        if self.output == "plain":
+            headers[1] = "Start"
+        if show_calendar:
+            headers.insert(2, "Calendar")
+        if color:
+            headers = list(map(cf.blue, headers))
+        tablefmt = "fancy_grid" if self.output == "grid" else "plain"
+        if not rows_per_table:
+            rows_per_table = self.page_size
+
+        table = list()
+        printed = False
+        for record in records:
+            emails = "\n".join(who["email"] for who in record["attendees"]) or "no@email.given"
+            if color:
+                status = "\n".join(str(cal_status_color(who["responseStatus"])) for who in record["attendees"])
+            else:
+                status = "\n".join(who["responseStatus"] for who in record["attendees"])
+            status = status or "Who knows..."
+
+            if self.output == "plain":
+                emails, status = emails.replace("\n", ","), status.replace("\n", ",")
+                row = [record["week"], record["start"], record["summary"], emails, status, record["id"]]
+            else:
+                row = [f"{record['week']}\n{record['end_week']}", f"{record['start']}\n{record['end']}",
+                       record["summary"], emails, status, record["id"]]
+            if show_calendar:
+                row.insert(2, record["calendar"])
+            if color and not record["attendees"]:
+                row[-3:-1] = map(cf.red, row[-3:-1])
+            table.append(row)
+
+            if len(table) >= rows_per_table:
+                yield tabulate(table, headers, tablefmt=tablefmt, stralign="left") + "\n"
+                table.clear()
+                printed = True
+                if self.output == "plain":
+                    headers = ()
+
+        if table or not printed:
+            yield tabulate(table, headers, tablefmt=tablefmt, stralign="left") + "\n"
+
+    @timed("render")
+    def print_rt_events(self, events, rows_per_table=None, show_calendar=False):
+        """
+        Print events (as self.output, see set_output) while they arrive.
+        :param events: iterable with events (e.g. generator from get_events)
+        :param rows_per_table: int, print a table for every rows_per_table events, so that the first rows are
+        printed before the last page of events arrives (default: self.page_size)
+        :param show_calendar: bool, add column with event["calendar"] (see get_events_calendars)
+        :return:
+        """
+        chunks = self.format_rt_events(events, rows_per_table=rows_per_table, show_calendar=show_calendar)
+        if self.pager and self.output == "grid" and sys.stdout is sys.__stdout__ and sys.stdout.isatty():
+            page(chunks)
+            return
+
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
 
     def add_shift(self, week, names, emails, institution="uiT", ukevakt=False, year=None):
         """
@@ -425,13 +1081,180 @@ class RTCalendar(MyCalendar):
         :param emails: [mail1, mail2...]
         :return:
         """
+        body = self.shift_body(week=week, names=names, emails=emails, institution=institution, ukevakt=ukevakt,
+                               year=year)
+        event = self.add_event(body)
+        print(event)
+
+    def add_shifts(self, shifts, batch_size=batch_limit):
+        """
+        Add several shifts with batch requests, and print a summary of added/failed shifts.
+        :param shifts: list with dicts of add_shift arguments (week, names, emails, institution, ukevakt, year)
+        :param batch_size: int, shifts per batch request
+        :return: list with (event, error) for each shift
+        """
+        bodies = [self.shift_body(**shift) for shift in shifts]
+        results = self.add_events(bodies, batch_size=batch_size)
+
+        headers = map(cf.blue, ["Week", "Summary", "Status", "Event id / Error"])
+        table = list()
+        for shift, body, (event, error) in zip(shifts, bodies, results):
+            if error is None:
+                table.append([shift["week"], body["summary"], cf.green("added"), event["id"]])
+            else:
+                table.append([shift["week"], body["summary"], cf.red("failed"), str(error)])
+        print(tabulate(table, headers, tablefmt="pretty", stralign="left"))
+
+        failed = len([error for event, error in results if error is not None])
+        print(f"Added {len(results) - failed} of {len(results)} shifts to {self.cal_name}.")
+        return results
+
+    def plan_roster(self, shifts):
+        """
+        Compare shifts (roster) with the calendar and plan the minimal changes to make the calendar match:
+        insert missing shifts, patch shifts with other staff/summary, delete duplicates and shifts not in roster.
+        The calendar is read once, for the weeks in roster. Only shifts (see is_shift) of the roster's institution
+        are touched, other events of the institution (meetings, partial weeks...) are listed, not deleted.
+        :param shifts: list with dicts of add_shift arguments (week, names, emails, institution, ukevakt, year)
+        :return: list with changes {"action": insert/patch/delete, "week", "event" (existing), "body" (new)}
+        """
+        plan = list()
+        if not shifts:
+            return plan
+
+        bodies = dict()
+        for shift in shifts:
+            body = self.shift_body(**shift)
+            bodies[body["start"]["date"]] = (shift, body)
+        institution = shifts[0]["institution"]
+        day1, day2 = min(bodies.keys()), max(bodies.keys())
+
+        existing = dict()
+        others = list()
+        for event in self.get_events(day1, day2, fields=event_fields["swap"]):
+            if not event.get("summary", "").lower().startswith(f"{institution.lower()}:"):
+                continue
+            if not self.is_shift(event):
+                others.append(event)
+                continue
+            existing.setdefault(event["start"]["date"], list()).append(event)
+
+        for day in sorted(set(bodies.keys()) | set(existing.keys())):
+            events = existing.get(day, [])
+            if day not in bodies:
+                plan += [{"action": "delete", "week": "", "event": event, "body": None} for event in events]
+                continue
+
+            shift, body = bodies[day]
+            if not events:
+                plan.append({"action": "insert", "week": shift["week"], "event": None, "body": body})
+                continue
+
+            # Keep first event in week, remove duplicates
+            event = events[0]
+            plan += [{"action": "delete", "week": shift["week"], "event": dup, "body": None} for dup in events[1:]]
+
+            emails = [who["email"] for who in body["attendees"]]
+            attendees = [who for who in event.get("attendees", []) if who.get("email") in emails]
+            attendees += [who for who in body["attendees"] if who["email"] not in
+                          [kept.get("email") for kept in attendees]]
+
+            change = dict()
+            if event.get("summary") != body["summary"]:
+                change["summary"] = body["summary"]
+            if sorted(who.get("email") for who in event.get("attendees", [])) != sorted(emails):
+                change["attendees"] = attendees
+            if change:
+                plan.append({"action": "patch", "week": shift["week"], "event": event, "body": change})
+
+        if others:
+            print(cf.orange(f"Not changing {len(others)} {institution} event(s) in the roster weeks that are not "
+                            f"shifts (all-day, monday to friday):"))
+            self.print_rt_events(others)
+        return plan
+
+    @staticmethod
+    def is_shift(event):
+        """
+        :param event: dict
+        :return: bool, True if event is shaped as a shift (see shift_body): all-day, starts on a monday and lasts
+        one week (five to seven days)
+        """
+        if "date" not in event.get("start", dict()) or "date" not in event.get("end", dict()):
+            return False
+        start = date.fromisoformat(event["start"]["date"])
+        days = (date.fromisoformat(event["end"]["date"]) - start).days
+        return start.weekday() == 0 and 5 <= days <= 7
+
+    @timed("render")
+    def print_plan(self, plan):
+        """
+        Print planned changes (see plan_roster) as a diff.
+        """
+        headers = map(cf.blue, ["Action", "Week", "In calendar", "After", "Event id"])
+        colors = {"insert": cf.green, "patch": cf.orange, "delete": cf.red}
+        table = list()
+        for change in plan:
+            event = change["event"] or dict()
+            body = change["body"] or dict()
+            before = event.get("summary", "")
+            after = body.get("summary", before) if change["action"] != "delete" else ""
+            if "attendees" in event or "attendees" in body:
+                before += "\n" + "/".join(who.get("email", "") for who in event.get("attendees", []))
+                if change["action"] != "delete":
+                    after += "\n" + "/".join(who.get("email", "") for who in
+                                             body.get("attendees", event.get("attendees", [])))
+            table.append(list(map(colors[change["action"]], [change["action"], change["week"], before, after,
+                                                             event.get("id", "")])))
+        print(tabulate(table, headers, tablefmt="pretty", stralign="left"))
+
+        actions = [change["action"] for change in plan]
+        print(f"{actions.count('insert')} insert(s), {actions.count('patch')} patch(es), "
+              f"{actions.count('delete')} delete(s) in {self.cal_name}.")
+
+    def apply_plan(self, plan, batch_size=batch_limit):
+        """
+        Execute planned changes (see plan_roster) in batch requests. Patches are conditional on the event ETag.
+        :return: dict {index in plan: (response, error)}
+        """
+        def request(change):
+            event = change["event"]
+            if change["action"] == "insert":
+                return lambda: self.calendar.events().insert(calendarId=self.id, body=change["body"],
+                                                             sendNotifications=True, sendUpdates="all")
+            if change["action"] == "delete":
+                return lambda: self.calendar.events().delete(calendarId=self.id, eventId=event["id"],
+                                                             sendUpdates="all")
+
+            def patch():
+                req = self.calendar.events().patch(calendarId=self.id, eventId=event["id"], body=change["body"],
+                                                   sendUpdates="all", fields="id,etag,updated")
+                if event.get("etag"):
+                    req.headers["If-Match"] = event["etag"]
+                return req
+            return patch
+
+        results = self.execute_batch({i: request(change) for i, change in enumerate(plan)}, batch_size=batch_size)
+        self.mirror_changed()
+
+        failed = [(plan[i], error) for i, (response, error) in results.items() if error is not None]
+        for change, error in failed:
+            print(cf.red(f"Failed to {change['action']} week {change['week']}: {error}"))
+        print(f"Applied {len(plan) - len(failed)} of {len(plan)} changes to {self.cal_name}.")
+        return results
+
+    def shift_body(self, week, names, emails, institution="uiT", ukevakt=False, year=None):
+        """
+        Event body for a RT shift (all-day event, monday-friday in week).
+        :return: dict
+        """
         if not week or not names:
             print("Missing arguments. Week (int) and names (list) must be provided")
 
         if not year:
             year = datetime.now().year
 
-        date_ = datetime.strptime(f'{year}-W{int(week)}-1', "%Y-W%W-%w").date()
+        date_ = week_to_date(year, week)[0]
 
         # Add (ukevakt) to summary if ukevakt
         uv = ""
@@ -465,47 +1288,88 @@ class RTCalendar(MyCalendar):
             "sendUpdates": "all",
             "sendNotifications": True,
         }
-        event = self.add_event(body)
-        print(event)
+        return body
 
     def swap_shifts(self, event_id1, event_id2):
         """
-        Swaps summary and attendees for events with id1 and id2
+        Swaps summary and attendees for events with id1 and id2 (see rotate_shifts)
         :param event_id1:
         :param event_id2:
-        :return:
+        :return: bool, True if swapped
         """
+        return self.rotate_shifts([event_id1, event_id2])
 
-        # Get the events
-        event1 = self.get_event(event_id1)
-        event2 = self.get_event(event_id2)
+    def rotate_shifts(self, event_ids):
+        """
+        Moves staff (summary and attendees) of each shift to the next shift in event_ids, and from the last to the
+        first. Two shifts is a swap. "(ukevakt)" stays with the shift.
+        All shifts are read in one batch and patched in one batch (conditional on ETags). If any patch fails, the
+        patched shifts are restored, so that nobody ends up on two shifts.
+        :param event_ids: list with event ids
+        :return: bool, True if all shifts were rotated
+        """
+        if len(event_ids) < 2 or len(set(event_ids)) != len(event_ids):
+            print("Need at least two different shifts (each only once) to swap/rotate.")
+            return False
 
-        print(cf.red("\nSwapping staff in shifts:"))
-        self.print_rt_events(events=[event1, event2])
+        def get(event_id):
+            return lambda: self.calendar.events().get(calendarId=self.id, eventId=event_id,
+                                                      fields=event_fields["swap"])
 
-        uv = ""
-        # Look for (ukevakt) and keep this from swapping!
-        # 1 --> 2
-        if "(ukevakt)" in event2["summary"]:
-            uv = " (ukevakt)"
-        summary2 = f"{event1['summary'].replace('(ukevakt)','')}{uv}"
-        attendees2 = event1["attendees"]
+        results = self.execute_batch({i: get(event_id) for i, event_id in enumerate(event_ids)})
+        for i, (event, error) in results.items():
+            if error is not None:
+                print(cf.red(f"Could not get event {event_ids[i]}: {error}. Nothing changed."))
+                return False
+        events = [results[i][0] for i in range(len(event_ids))]
 
-        # 2 --> 1
-        uv = ""
-        if "(ukevakt)" in event1["summary"]:
-            uv = " (ukevakt)"
-        summary1 = f"{event2['summary'].replace('(ukevakt)','')}{uv}"
-        attendees1 = event2["attendees"]
+        print(cf.red("\nSwapping staff in shifts:"))
+        self.print_rt_events(events=events)
 
-        event1["summary"] = summary1
-        event1["attendees"] = attendees1
-        self.update_event(body=event1, event_id=event_id1)
+        # Look for (ukevakt) and keep this from swapping!
+        changes = list()
+        for i, event in enumerate(events):
+            staff = events[i - 1]
+            uv = ""
+            if "(ukevakt)" in event["summary"]:
+                uv = " (ukevakt)"
+            changes.append({"summary": f"{staff['summary'].replace('(ukevakt)', '').strip()}{uv}",
+                            "attendees": staff.get("attendees", [])})
+
+        updated = self.patch_events(events, changes)
+        failed = [i for i, (response, error) in updated.items() if error is not None]
+        if failed:
+            for i in failed:
+                print(cf.red(f"Could not update event {events[i]['id']}: {updated[i][1]}"))
+            self.rollback_shifts(events, updated)
+            return False
+
+        for event, change in zip(events, changes):
+            event.update(change)
+        print(cf.red("\nSwap completed:"))
+        self.print_rt_events(events=events)
+        return True
 
-        event2["summary"] = summary2
-        event2["attendees"] = attendees2
-        self.update_event(body=event2, event_id=event_id2)
+    def rollback_shifts(self, events, updated):
+        """
+        Restore summary and attendees of events that were patched (compensation for a failed rotate_shifts).
+        :param events: list with original events
+        :param updated: dict {index: (response, error)} from patch_events
+        """
+        restore = [i for i, (response, error) in updated.items() if error is None]
+        if not restore:
+            print(cf.orange("No shifts were changed."))
+            return
 
-        print(cf.red("\nSwap completed:"))
-        self.print_rt_events(events=[event1, event2])
+        originals = list()
+        for i in restore:
+            # Patch on top of our own change only (new ETag)
+            originals.append(dict(events[i], etag=updated[i][0].get("etag")))
+        restored = self.patch_events(originals, [{"summary": events[i]["summary"],
+                                                  "attendees": events[i].get("attendees", [])} for i in restore])
 
+        not_restored = [originals[j]["id"] for j, (response, error) in restored.items() if error is not None]
+        if not_restored:
+            print(cf.red(f"Could not restore events {', '.join(not_restored)}. Please check them!"))
+        else:
+            print(cf.orange(f"Restored {len(restore)} shift(s). Nothing changed."))
@@ -0,0 +1,143 @@
+"""Gcal_credentials.py: Google API credentials loaded once per process, refreshed safely across processes."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import fcntl
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+# Credentials loaded in this process {(token file, scopes): Credentials}
+_loaded = dict()
+_loaded_lock = threading.Lock()
+# Access token last read from or written to the token file {(token file, scopes): token}
+_written = dict()
+
+
+class CredentialManager:
+    """
+    Gives valid credentials for a token file. The token file is read once per process, and credentials are refreshed
+    before they expire. Refresh and writing of the token file are serialized between processes with a file lock,
+    and the token file is replaced atomically, so parallel CLI runs never read a half written token.
+    """
+    def __init__(self, token, credentialsfile, scopes, refresh_margin=300):
+        """
+        :param token: str (path), file with user's access and refresh tokens
+        :param credentialsfile: str (path), client secret file (to create token if missing)
+        :param scopes: list with scopes
+        :param refresh_margin: int, refresh when credentials expire within this many seconds
+        """
+        self.token = os.path.abspath(token)
+        self.credentialsfile = credentialsfile
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.key = (self.token, tuple(scopes))
+
+    @contextmanager
+    def lock(self, exclusive=True):
+        """
+        File lock (token file + .lock) shared by all processes using the token.
+        """
+        with open(f"{self.token}.lock", "a") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def expiring(self, credentials):
+        """
+        :return: bool, True if credentials are missing, invalid or expire within refresh_margin
+        """
+        if not credentials or not credentials.valid:
+            return True
+        if credentials.expiry is None:
+            return False
+        return credentials.expiry - datetime.utcnow() < timedelta(seconds=self.refresh_margin)
+
+    def read(self):
+        if not os.path.exists(self.token):
+            return None
+        credentials = Credentials.from_authorized_user_file(filename=self.token, scopes=self.scopes)
+        _written[self.key] = credentials.token
+        return credentials
+
+    def write(self, credentials):
+        tmp_file = f"{self.token}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as token:
+            token.write(credentials.to_json())
+        os.replace(tmp_file, self.token)
+        _written[self.key] = credentials.token
+
+    def get(self):
+        """
+        :return: valid credentials
+        """
+        with _loaded_lock:
+            credentials = _loaded.get(self.key)
+            if credentials is None:
+                with self.lock(exclusive=False):
+                    credentials = self.read()
+
+            if self.expiring(credentials):
+                credentials = self.refresh(credentials)
+            _loaded[self.key] = credentials
+        return credentials
+
+    def fresh(self, credentials):
+        """
+        Keep credentials of a long running process (the daemon) valid: refresh them (through the token file) when
+        they expire within refresh_margin, and write a token that google-auth refreshed in memory (after a 401) to
+        the token file, so other processes do not refresh it again. Called before each request.
+        :param credentials: credentials from get (updated in place)
+        """
+        if not self.expiring(credentials) and _written.get(self.key) == credentials.token:
+            return
+        with _loaded_lock:
+            if self.expiring(credentials):
+                self.refresh(credentials)
+            elif _written.get(self.key) != credentials.token:
+                with self.lock(exclusive=True):
+                    if self.expiring(self.read()):
+                        self.write(credentials)
+                    _written[self.key] = credentials.token
+
+    def refresh(self, credentials=None):
+        """
+        Refresh credentials (or create them from client secret file) and write token file, holding the file lock.
+        Credentials are refreshed in place, so that services and http transports using them get the new token.
+        :param credentials: credentials to refresh (None: read from token file)
+        :return: credentials
+        """
+        with self.lock(exclusive=True):
+            # Another process may have refreshed the token while we waited for the lock
+            stored = self.read()
+            if not self.expiring(stored):
+                if credentials is None:
+                    return stored
+                credentials.token = stored.token
+                credentials.expiry = stored.expiry
+                return credentials
+
+            credentials = credentials or stored
+            if credentials and credentials.refresh_token:
+                credentials.refresh(Request())
+            else:
+                print("No valid token. Generating from secret credential file....", file=sys.stderr)
+                flow = InstalledAppFlow.from_client_secrets_file(self.credentialsfile, self.scopes)
+                credentials = flow.run_local_server(port=0)
+
+            self.write(credentials)
+        return credentials
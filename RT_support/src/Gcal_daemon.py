@@ -0,0 +1,211 @@
+"""Gcal_daemon.py: Background process keeping the calendar service warm, and thin client for the calendar CLIs."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import builtins
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from .Gcal_profile import stop_profiling
+
+# CLIs (module names in RT_support) the daemon runs for clients
+daemon_scripts = ["add_shift", "print_events", "swap_shifts", "edit_event", "delete_event", "event_reminder",
+                  "respond_event"]
+
+
+def send(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+class ClientWriter:
+    """
+    File-like object sending everything written (stdout or stderr of a CLI run in the daemon) to the client.
+    """
+    def __init__(self, stream, tty=False, channel="out"):
+        """
+        :param channel: str, out (stdout) or err (stderr) of the client
+        """
+        self.stream = stream
+        self.tty = tty
+        self.channel = channel
+
+    def write(self, text):
+        if text:
+            send(self.stream, {self.channel: text})
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        # Output ends up in the client's terminal (or pipe)
+        return self.tty
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """
+    Runs one CLI command for a client: {"script": name, "args": [...], "cwd": path, "tty": bool, "tty_err": bool}.
+    Output is sent back as {"out": text} (stdout) and {"err": text} (stderr), input() as {"input": prompt}
+    (answered with {"line": text}), and finally {"exit": code}. {"exit": null} tells the client to run the command itself.
+    """
+    def handle(self):
+        stream = TextStream(self.wfile)
+        request = json.loads(self.rfile.readline() or b"{}")
+
+        if request.get("stop"):
+            send(stream, {"exit": 0})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+
+        script = request.get("script")
+        if script not in daemon_scripts:
+            send(stream, {"exit": None})
+            return
+
+        def client_input(prompt=""):
+            send(stream, {"input": str(prompt)})
+            return json.loads(self.rfile.readline() or b"{}").get("line", "")
+
+        writer = ClientWriter(stream, tty=request.get("tty", False))
+        errors = ClientWriter(stream, tty=request.get("tty_err", False), channel="err")
+        code = 0
+        cwd = os.getcwd()
+        real_input = builtins.input
+        try:
+            os.chdir(request.get("cwd", cwd))
+            builtins.input = client_input
+            with redirect_stdout(writer), redirect_stderr(errors):
+                # Reload, so that module defaults (this week, this year...) are fresh
+                module = importlib.reload(importlib.import_module(script))
+                try:
+                    module.main.main(args=request.get("args", []), prog_name=script, standalone_mode=True)
+                finally:
+                    # Summary of --profile goes to the client
+                    stop_profiling()
+        except SystemExit as err:
+            if isinstance(err.code, str):
+                errors.write(err.code + "\n")
+                code = 1
+            else:
+                code = err.code or 0
+        except Exception:
+            errors.write(traceback.format_exc())
+            code = 1
+        finally:
+            builtins.input = real_input
+            os.chdir(cwd)
+
+        send(stream, {"exit": code})
+
+
+class TextStream:
+    """
+    Text wrapper around the (binary) socket file of a request handler.
+    """
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode("utf-8"))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class CalendarDaemon(socketserver.UnixStreamServer):
+    """
+    Unix domain socket server running calendar CLIs one at a time, in a process where credentials, the calendar
+    service (with its keep-alive connection) and calendar/event caches are already loaded.
+    """
+    def __init__(self, socket_file):
+        if os.path.exists(socket_file):
+            sock = client_connect(socket_file)
+            if sock:
+                sock.close()
+                raise SystemExit(f"ABORTING: cliNRIS daemon is already running ({socket_file}).")
+            os.remove(socket_file)
+        # The socket runs CLIs with the owner's Google credentials: only the owner may connect, also while binding
+        umask = os.umask(0o177)
+        try:
+            super(CalendarDaemon, self).__init__(socket_file, DaemonHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_file, 0o600)
+        self.socket_file = socket_file
+
+    def server_close(self):
+        super(CalendarDaemon, self).server_close()
+        if os.path.exists(self.socket_file):
+            os.remove(self.socket_file)
+
+
+def client_connect(socket_file):
+    """
+    :return: connected socket, or None if no daemon is listening on socket_file
+    """
+    if not os.path.exists(socket_file):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_file)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def run_in_daemon(socket_file, script, args):
+    """
+    Run CLI script with args in the daemon, printing its output here.
+    :param socket_file: str (path)
+    :param script: str, CLI module name (e.g. print_events)
+    :param args: list with command line arguments
+    :return: exit code, or None if the daemon is not running (or does not run script)
+    """
+    sock = client_connect(socket_file)
+    if not sock:
+        return None
+
+    with sock, sock.makefile("rw", encoding="utf-8") as stream:
+        send(stream, {"script": script, "args": args, "cwd": os.getcwd(), "tty": sys.stdout.isatty(),
+                      "tty_err": sys.stderr.isatty()})
+        for line in stream:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "err" in message:
+                sys.stderr.write(message["err"])
+                sys.stderr.flush()
+            elif "input" in message:
+                send(stream, {"line": input(message["input"])})
+            elif "exit" in message:
+                return message["exit"]
+    return None
+
+
+def stop_daemon(socket_file):
+    """
+    :return: bool, True if a running daemon was asked to stop
+    """
+    sock = client_connect(socket_file)
+    if not sock:
+        return False
+    with sock, sock.makefile("rw", encoding="utf-8") as stream:
+        send(stream, {"stop": True})
+        stream.readline()
+    return True
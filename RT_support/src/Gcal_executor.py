@@ -0,0 +1,151 @@
+"""Gcal_executor.py: Rate limited execution of Google API requests with retries (exponential backoff)."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import json
+import random
+import sys
+import threading
+import time
+from googleapiclient.errors import HttpError
+from .Gcal_profile import trace_request
+
+# 403 reasons that mean "slow down" (quota), not "forbidden"
+rate_limit_reasons = ["rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"]
+
+
+def error_reason(err):
+    """
+    :param err: HttpError
+    :return: str, reason given by Google (e.g. rateLimitExceeded) or None
+    """
+    try:
+        return json.loads(err.content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def is_rate_limited(err):
+    """
+    :param err: Exception
+    :return: bool, True if err is a quota/rate limit error (429 or 403 with rate limit reason)
+    """
+    if not isinstance(err, HttpError):
+        return False
+    return err.resp.status == 429 or (err.resp.status == 403 and error_reason(err) in rate_limit_reasons)
+
+
+def is_retryable(err):
+    """
+    :param err: Exception
+    :return: bool, True if the request may succeed if sent again (rate limits and 5xx server errors)
+    """
+    if not isinstance(err, HttpError):
+        return False
+    return is_rate_limited(err) or err.resp.status >= 500
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are refilled at rate per second, up to burst. The rate adapts: it is halved
+    when Google says we are too fast, and increased slowly again (up to max_rate) while requests succeed.
+    """
+    def __init__(self, rate=5.0, burst=10, min_rate=0.5):
+        """
+        :param rate: float, requests per second
+        :param burst: int, max requests sent without waiting
+        :param min_rate: float, lowest rate after slowing down
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """
+        Take n tokens, and wait until they are paid for. More than available (e.g. a batch larger than burst) puts
+        the bucket in deficit, so the caller waits for n - tokens at the refill rate, and later callers wait for the
+        deficit too.
+        :param n: int, number of requests (a batch request counts all requests in it)
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+
+class RequestExecutor:
+    """
+    Executes Google API requests (HttpRequest/BatchHttpRequest) through a token bucket, with at most
+    max_concurrency requests in flight, and retries rate limit and server (5xx) errors with exponential backoff
+    and jitter.
+    """
+    def __init__(self, rate=5.0, burst=10, max_concurrency=4, max_retries=5, base_delay=1.0, max_delay=32.0):
+        """
+        :param rate: float, max requests per second
+        :param burst: int, max requests sent without waiting
+        :param max_concurrency: int, max requests in flight at the same time (all threads)
+        :param max_retries: int, retries of a failed request before giving up
+        :param base_delay: float, seconds to wait before first retry (doubled for each retry)
+        :param max_delay: float, max seconds to wait before a retry
+        """
+        self.bucket = TokenBucket(rate=rate, burst=burst)
+        self.concurrency = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, err=None):
+        """
+        Sleep before retry number attempt (exponential backoff with full jitter).
+        :param attempt: int, 0 for first retry
+        :param err: the error causing the retry (rate limit errors also slow down the token bucket)
+        """
+        if err is not None and is_rate_limited(err):
+            self.bucket.slow_down()
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def execute(self, request, http=None, tokens=1):
+        """
+        Execute request, retrying rate limit and server errors.
+        :param request: HttpRequest or BatchHttpRequest
+        :param http: http transport (for worker threads, see GoogleCalendarService.thread_http)
+        :param tokens: int, requests counted against the rate limit (number of requests in a batch)
+        :return: response of request
+        """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(tokens)
+            try:
+                with self.concurrency:
+                    response = trace_request(request, lambda: request.execute(http=http))
+            except HttpError as err:
+                if not is_retryable(err) or attempt == self.max_retries:
+                    raise
+                print(f"Request failed ({err.resp.status} {error_reason(err) or ''}). Retrying...", file=sys.stderr)
+                self.backoff(attempt, err)
+                continue
+
+            self.bucket.speed_up()
+            return response
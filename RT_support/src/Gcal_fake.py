@@ -0,0 +1,252 @@
+"""Gcal_fake.py: In-memory stand-in for the Google calendar API (offline testing and benchmarks of RTCalendar)."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import email
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qsl, unquote
+import httplib2
+
+api_root = "/calendar/v3"
+batch_path = "/batch/calendar/v3"
+
+# Calendars of a new backend {id: summary}
+fake_calendars = {
+    "rt@fake.calendar.google.com": "1.linje-vaktliste",
+    "someone@example.com": "someone@example.com",
+}
+
+reasons = {400: "badRequest", 403: "rateLimitExceeded", 404: "notFound", 410: "fullSyncRequired",
+           412: "conditionNotMet"}
+status_text = {200: "OK", 204: "No Content", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 410: "Gone",
+               412: "Precondition Failed"}
+
+
+def to_datetime(value):
+    """
+    :param value: str, date (year-month-day) or RFC 3339 time
+    :return: datetime (UTC)
+    """
+    if len(value) == 10:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def event_time(event, key):
+    return to_datetime(event[key].get("dateTime", event[key].get("date")))
+
+
+def error_body(status, message):
+    return {"error": {"code": status, "message": message,
+                      "errors": [{"reason": reasons.get(status, "backendError"), "message": message}]}}
+
+
+class FakeCalendarBackend:
+    """
+    Calendars and events kept in memory, answering the calendar API calls used in Gcal_API/Gcal_mirror
+    (calendarList.list and events.list/get/insert/patch/update/delete, with ETags, paging and sync tokens).
+    Partial responses (fields=) are not applied, full resources are returned.
+    Each HTTP round trip waits latency seconds, and a fraction (quota_error_rate) of the API calls are answered
+    with 403 rateLimitExceeded, to see how the client copes with slow connections and quota errors.
+    """
+    def __init__(self, latency=0.0, quota_error_rate=0.0, seed=0, calendars=None):
+        """
+        :param latency: float, seconds for each HTTP round trip (a batch is one round trip)
+        :param quota_error_rate: float, 0-1, fraction of API calls failing with 403 rateLimitExceeded
+        :param seed: int, seed for the random quota errors
+        :param calendars: dict {id: summary} (default: fake_calendars)
+        """
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calendars = dict(calendars or fake_calendars)
+        self.events = {calendar_id: dict() for calendar_id in self.calendars}
+        # Change sequence of each event (for sync tokens) {(calendar id, event id): sequence}
+        self.changed = dict()
+        self.sequence = 0
+        self.stats = dict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"http": 0, "calls": 0, "quota_errors": 0}
+
+    def touch(self, calendar_id, event):
+        self.sequence += 1
+        self.changed[(calendar_id, event["id"])] = self.sequence
+        event["etag"] = f'"{self.sequence}"'
+        event["updated"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+    def handle(self, method, path, query, headers, body):
+        """
+        Answer one API call.
+        :param method: str, GET, POST, PATCH, PUT or DELETE
+        :param path: str, path below /calendar/v3 (unquoted)
+        :param query: dict with query parameters
+        :param headers: dict with (lower case) headers
+        :param body: dict or None
+        :return: status (int), response body (dict or None)
+        """
+        with self.lock:
+            self.stats["calls"] += 1
+            if self.quota_error_rate and self.random.random() < self.quota_error_rate:
+                self.stats["quota_errors"] += 1
+                return 403, error_body(403, "Rate Limit Exceeded")
+
+            parts = path.strip("/").split("/")
+            if parts == ["users", "me", "calendarList"] and method == "GET":
+                return 200, {"kind": "calendar#calendarList",
+                             "items": [{"id": cid, "summary": name} for cid, name in self.calendars.items()]}
+
+            if len(parts) < 3 or parts[0] != "calendars" or parts[2] != "events" or parts[1] not in self.events:
+                return 404, error_body(404, "Not Found")
+            calendar_id = parts[1]
+
+            if len(parts) == 3:
+                if method == "GET":
+                    return self.list_events(calendar_id, query)
+                if method == "POST":
+                    return self.insert_event(calendar_id, body or dict())
+                return 400, error_body(400, f"{method} not supported")
+
+            event = self.events[calendar_id].get(parts[3])
+            if event is None or (event.get("status") == "cancelled" and method != "GET"):
+                return 404, error_body(404, "Not Found")
+            if method != "GET" and headers.get("if-match") not in (None, "*", event["etag"]):
+                return 412, error_body(412, "Precondition Failed")
+
+            if method == "GET":
+                if event.get("status") == "cancelled":
+                    return 404, error_body(404, "Not Found")
+                return 200, event
+            if method == "PATCH":
+                event.update({key: value for key, value in (body or dict()).items() if key not in ("id", "etag")})
+            elif method == "PUT":
+                event = dict(body or dict(), id=event["id"], status="confirmed")
+                self.events[calendar_id][event["id"]] = event
+            elif method == "DELETE":
+                event["status"] = "cancelled"
+                self.touch(calendar_id, event)
+                return 204, None
+            else:
+                return 400, error_body(400, f"{method} not supported")
+            self.touch(calendar_id, event)
+            return 200, event
+
+    def insert_event(self, calendar_id, body):
+        event = dict(body, id=f"fake{self.sequence + 1:010d}", status="confirmed", kind="calendar#event")
+        for attendee in event.get("attendees", []):
+            attendee.setdefault("responseStatus", "needsAction")
+        self.events[calendar_id][event["id"]] = event
+        self.touch(calendar_id, event)
+        return 200, event
+
+    def list_events(self, calendar_id, query):
+        """
+        events().list: timeMin/timeMax, orderBy=startTime, maxResults/pageToken and syncToken (changes only).
+        """
+        events = self.events[calendar_id]
+        sync_token = query.get("syncToken")
+        if sync_token:
+            if not sync_token.isdigit() or int(sync_token) > self.sequence:
+                return 410, error_body(410, "Sync token is no longer valid, a full sync is required.")
+            selected = [event for event in events.values()
+                        if self.changed[(calendar_id, event["id"])] > int(sync_token)]
+        else:
+            selected = [event for event in events.values() if event.get("status") != "cancelled"]
+            if "timeMin" in query:
+                time_min = to_datetime(query["timeMin"])
+                selected = [event for event in selected if event_time(event, "end") > time_min]
+            if "timeMax" in query:
+                time_max = to_datetime(query["timeMax"])
+                selected = [event for event in selected if event_time(event, "start") < time_max]
+
+        if query.get("orderBy") == "startTime" or not sync_token:
+            selected.sort(key=lambda event: (event_time(event, "start"), event["id"]))
+
+        offset = int(query.get("pageToken") or 0)
+        page_size = min(int(query.get("maxResults", 250)), 2500)
+        page = {"kind": "calendar#events", "items": selected[offset:offset + page_size]}
+        if offset + page_size < len(selected):
+            page["nextPageToken"] = str(offset + page_size)
+        else:
+            page["nextSyncToken"] = str(self.sequence)
+        return 200, page
+
+
+class FakeHttp:
+    """
+    httplib2.Http stand-in sending requests to a FakeCalendarBackend instead of Google (also batch requests).
+    Use as http transport for the calendar service: GoogleCalendarService(..., http=FakeHttp(backend)).
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        headers = {key.lower(): value for key, value in (headers or dict()).items()}
+        with self.backend.lock:
+            self.backend.stats["http"] += 1
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+
+        parsed = urlparse(uri)
+        if parsed.path == batch_path:
+            return self.batch(body, headers)
+        status, content = self.call(method, parsed.path, parsed.query, headers, body)
+        return httplib2.Response({"status": status, "content-type": "application/json"}), content
+
+    def call(self, method, path, query, headers, body):
+        """
+        :return: status, content (bytes)
+        """
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            return 400, json.dumps(error_body(400, "Invalid JSON")).encode("utf-8")
+
+        path = unquote(path[len(api_root):] if path.startswith(api_root) else path)
+        status, response = self.backend.handle(method, path, dict(parse_qsl(query)), headers, body)
+        return status, b"" if response is None else json.dumps(response).encode("utf-8")
+
+    def batch(self, body, headers):
+        """
+        Answer a multipart/mixed batch request, each part (application/http) is one API call.
+        """
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        message = email.message_from_string(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+
+        boundary = f"batch_fake_{self.backend.sequence}"
+        parts = list()
+        for part in message.get_payload():
+            request_line, payload = part.get_payload().split("\n", 1)
+            method, uri, protocol = request_line.strip().split(" ", 2)
+            sub_request = email.message_from_string(payload)
+            parsed = urlparse(uri)
+            status, content = self.call(method, parsed.path, parsed.query,
+                                        {key.lower(): value for key, value in sub_request.items()},
+                                        sub_request.get_payload())
+            content_id = part["Content-ID"].strip("<>")
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>"
+                         f"\r\n\r\nHTTP/1.1 {status} {status_text.get(status, 'Error')}\r\n"
+                         f"Content-Type: application/json\r\n\r\n{content.decode('utf-8')}\r\n")
+
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        response = httplib2.Response({"status": 200, "content-type": f"multipart/mixed; boundary={boundary}"})
+        return response, content.encode("utf-8")
@@ -0,0 +1,235 @@
+"""Gcal_mirror.py: Local (SQLite) mirror of Google calendar events, kept up to date with incremental sync."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import json
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+from googleapiclient.errors import HttpError
+from .Gcal_profile import timed
+from .static_methods import date_to_week
+
+# Fields stored for each event in the mirror (status is needed to see cancelled events in deltas)
+mirror_fields = "id,status,summary,start,end,attendees(email,responseStatus)"
+
+
+class EventMirror:
+    """
+    Local copy of calendar events. The first sync lists all events of a calendar, later syncs only ask Google
+    for what changed since last time (events().list with syncToken).
+    """
+    def __init__(self, filename, max_age=None):
+        """
+        :param filename: SQLite file to keep the mirror in
+        :param max_age: float, seconds before a calendar is synced again (None: once per process)
+        """
+        self.filename = filename
+        self.max_age = max_age
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                start TEXT NOT NULL,
+                start_day TEXT NOT NULL,
+                end_day TEXT NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, id)
+            );
+            CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_day);
+            CREATE TABLE IF NOT EXISTS shifts (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                week INTEGER NOT NULL,
+                institution TEXT,
+                email TEXT
+            );
+            CREATE INDEX IF NOT EXISTS shifts_week ON shifts (calendar_id, year, week);
+            CREATE INDEX IF NOT EXISTS shifts_email ON shifts (calendar_id, email);
+            CREATE INDEX IF NOT EXISTS shifts_event ON shifts (calendar_id, event_id);
+            CREATE TABLE IF NOT EXISTS sync (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT,
+                synced TEXT
+            );
+        """)
+
+        # calendars synced by this process {calendar id: time.monotonic() of sync}
+        self.synced = dict()
+
+    def expire(self, calendar_id):
+        """
+        Sync calendar_id again on next read (after changes made by this process).
+        """
+        self.synced.pop(calendar_id, None)
+
+    def sync_token(self, calendar_id):
+        row = self.db.execute("SELECT sync_token FROM sync WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def clear(self, calendar_id):
+        """
+        Forget all events and the sync token for calendar_id.
+        """
+        with self.db:
+            self.db.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self.db.execute("DELETE FROM shifts WHERE calendar_id = ?", (calendar_id,))
+            self.db.execute("DELETE FROM sync WHERE calendar_id = ?", (calendar_id,))
+
+    @timed("sync")
+    def sync(self, cal, force=False):
+        """
+        Bring the mirror of cal up to date. Full sync if there is no sync token (or Google says it is no longer
+        valid, 410 Gone), otherwise only the changes since last sync.
+        :param cal: MyCalendar (or subclass) with calendar service and id
+        :param force: bool, sync even if calendar was already synced by this process
+        :return: int, number of changed events
+        """
+        if cal.id in self.synced and not force:
+            if self.max_age is None or time.monotonic() - self.synced[cal.id] < self.max_age:
+                return 0
+
+        sync_token = self.sync_token(cal.id)
+        if sync_token and not self.db.execute("SELECT 1 FROM shifts WHERE calendar_id = ? LIMIT 1",
+                                              (cal.id,)).fetchone():
+            # Nothing in shift index (mirror from before the index existed): full sync
+            sync_token = None
+
+        try:
+            changes = self._sync(cal, sync_token)
+        except HttpError as err:
+            if err.resp.status != 410:
+                raise
+            print("Event mirror is out of date. Full sync...", file=sys.stderr)
+            self.clear(cal.id)
+            changes = self._sync(cal, None)
+
+        self.synced[cal.id] = time.monotonic()
+        return changes
+
+    def _sync(self, cal, sync_token):
+        changes = 0
+        page_token = None
+        with self.db:
+            if not sync_token:
+                self.db.execute("DELETE FROM events WHERE calendar_id = ?", (cal.id,))
+                self.db.execute("DELETE FROM shifts WHERE calendar_id = ?", (cal.id,))
+
+            while True:
+                page = cal.execute(cal.calendar.events().list(
+                    calendarId=cal.id, singleEvents=True, maxResults=2500,
+                    syncToken=sync_token, pageToken=page_token,
+                    fields=f"nextPageToken,nextSyncToken,items({mirror_fields})"
+                ))
+
+                for event in page.get("items", []):
+                    self.store(cal.id, event)
+                    changes += 1
+
+                page_token = page.get("nextPageToken")
+                if not page_token:
+                    break
+
+            self.db.execute("INSERT OR REPLACE INTO sync (calendar_id, sync_token, synced) VALUES (?, ?, ?)",
+                            (cal.id, page.get("nextSyncToken"), datetime.utcnow().isoformat()))
+        return changes
+
+    def store(self, calendar_id, event):
+        """
+        Insert/update event in mirror (and shift index), or remove it if cancelled.
+        """
+        self.db.execute("DELETE FROM shifts WHERE calendar_id = ? AND event_id = ?", (calendar_id, event["id"]))
+        if event.get("status") == "cancelled" or "start" not in event:
+            self.db.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event["id"]))
+            return
+
+        start = event["start"].get("dateTime", event["start"].get("date", ""))
+        start_day = start[:10]
+        if "date" in event["end"]:
+            # All-day events end (exclusive) on end date
+            end_day = event["end"]["date"]
+        else:
+            end_day = str(date.fromisoformat(event["end"]["dateTime"][:10]) + timedelta(days=1))
+
+        self.db.execute("INSERT OR REPLACE INTO events (calendar_id, id, start, start_day, end_day, body) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (calendar_id, event["id"], start, start_day, end_day, json.dumps(event)))
+        self.index_shift(calendar_id, event, start_day)
+
+    def index_shift(self, calendar_id, event, start_day):
+        """
+        Index event by (year, week) of start (see date_to_week), institution (summary "UiT: Name/Name") and attendee
+        emails.
+        """
+        year, week = date_to_week(date.fromisoformat(start_day))
+        institution = None
+        if ":" in event.get("summary", ""):
+            institution = event["summary"].split(":")[0].strip().lower()
+
+        emails = [who.get("email") for who in event.get("attendees", [])] or [None]
+        self.db.executemany("INSERT INTO shifts (calendar_id, event_id, year, week, institution, email) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            [(calendar_id, event["id"], year, week, institution, email) for email in emails])
+
+    def events(self, calendar_id, from_date=None, to_date=None):
+        """
+        Events in mirror overlapping from_date - to_date, ordered by start.
+        :param calendar_id: str
+        :param from_date: year-month-day (None: no lower limit)
+        :param to_date: year-month-day (None: no upper limit)
+        :return: generator with events
+        """
+        query = "SELECT body FROM events WHERE calendar_id = ?"
+        args = [calendar_id]
+        if from_date:
+            query += " AND end_day > ?"
+            args.append(str(from_date))
+        if to_date:
+            query += " AND start_day <= ?"
+            args.append(str(to_date))
+        query += " ORDER BY start, id"
+
+        for row in self.db.execute(query, args):
+            yield json.loads(row[0])
+
+    def find_shifts(self, calendar_id, week_start=None, email=None, institution=None, from_date=None):
+        """
+        Look up shifts (events) in the shift index.
+        :param calendar_id: str
+        :param week_start: date, only shifts starting this day or the next 6 days (first day from week_to_date, the
+        week shift_body creates the shift in)
+        :param email: str, attendee in shift
+        :param institution: str, institution in shift summary (case insensitive)
+        :param from_date: year-month-day, only shifts ending after this day
+        :return: list with events, ordered by start
+        """
+        query = "SELECT DISTINCT e.body, e.start FROM shifts s JOIN events e " \
+                "ON e.calendar_id = s.calendar_id AND e.id = s.event_id WHERE s.calendar_id = ?"
+        args = [calendar_id]
+        if week_start:
+            query += " AND e.start_day >= ? AND e.start_day < ?"
+            args += [str(week_start), str(week_start + timedelta(days=7))]
+        if email is not None:
+            query += " AND s.email = ?"
+            args.append(email)
+        if institution:
+            query += " AND s.institution = ?"
+            args.append(institution.lower())
+        if from_date:
+            query += " AND e.end_day > ?"
+            args.append(str(from_date))
+        query += " ORDER BY e.start, e.id"
+
+        return [json.loads(row[0]) for row in self.db.execute(query, args)]
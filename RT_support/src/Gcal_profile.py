@@ -0,0 +1,254 @@
+"""Gcal_profile.py: Tracing of Google API calls and timing of CLI phases (--profile with the calendar CLIs)."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import cProfile
+import functools
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse, parse_qsl
+from tabulate import tabulate
+
+# Active profiler (None when not profiling, see start_profiling)
+profiler = None
+
+# Query parameters not worth showing in the call trace
+hidden_params = ["alt", "prettyPrint"]
+
+
+def describe_request(request):
+    """
+    :param request: HttpRequest or BatchHttpRequest
+    :return: method (e.g. calendar.events.list), dict with parameters (path and query of the request)
+    """
+    sub_requests = getattr(request, "_requests", None)
+    if sub_requests is not None:
+        methods = sorted(set(getattr(sub, "methodId", "?") for sub in sub_requests.values()))
+        return f"batch[{len(sub_requests)}] {', '.join(methods)}", dict()
+
+    uri = urlparse(getattr(request, "uri", ""))
+    params = {key: value for key, value in parse_qsl(uri.query) if key not in hidden_params}
+    path = uri.path.split("/calendar/v3", 1)[-1]
+    if path:
+        params = {"path": path, **params}
+    return getattr(request, "methodId", None) or getattr(request, "method", "?"), params
+
+
+def short(value, length=40):
+    value = str(value)
+    if len(value) > length:
+        return value[:length - 3] + "..."
+    return value
+
+
+class Profiler:
+    """
+    Records every Google API call (method, parameters, status, bytes, latency), and the time spent in each phase
+    of a CLI (import, token, build, calendars, sync, fetch, render...). Phase times are exclusive: time in a phase
+    started inside another phase counts for the inner phase only. Phases are timed in the thread that started
+    profiling; API calls are recorded from all threads.
+    """
+    def __init__(self, stats_file=None):
+        """
+        :param stats_file: str (path), write cProfile stats to this file (None: no cProfile)
+        """
+        self.start = time.perf_counter()
+        self.thread = threading.get_ident()
+        self.lock = threading.Lock()
+        self.calls = list()
+        self.phases = dict()
+        self.stack = list()
+        self.stats_file = None
+        self.cprofile = None
+        if stats_file:
+            self.enable_cprofile(stats_file)
+
+    def enable_cprofile(self, stats_file):
+        self.stats_file = stats_file
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the code in the with block as phase name.
+        """
+        if threading.get_ident() != self.thread:
+            yield
+            return
+
+        now = time.perf_counter()
+        if self.stack:
+            self.add_time(self.stack[-1][0], now - self.stack[-1][1])
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, start = self.stack.pop()
+            self.add_time(name, now - start)
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def trace(self, request, execute):
+        """
+        Execute request (execute() sends it), recording the call.
+        :param request: HttpRequest or BatchHttpRequest
+        :param execute: function without arguments executing request
+        :return: response
+        """
+        method, params = describe_request(request)
+        received = {"status": None, "bytes": 0}
+
+        # Response status and size are seen by postproc (of each request in a batch)
+        def wrap(sub_request):
+            postproc = sub_request.postproc
+
+            def measured(resp, content):
+                received["status"] = received["status"] or getattr(resp, "status", None)
+                received["bytes"] += len(content or b"")
+                return postproc(resp, content)
+            sub_request.postproc = measured
+            return postproc
+
+        sub_requests = list(getattr(request, "_requests", {}).values()) or [request]
+        originals = [wrap(sub_request) for sub_request in sub_requests if hasattr(sub_request, "postproc")]
+
+        start = time.perf_counter()
+        try:
+            response = execute()
+        except Exception as err:
+            resp = getattr(err, "resp", None)
+            received["status"] = getattr(resp, "status", type(err).__name__)
+            received["bytes"] += len(getattr(err, "content", b"") or b"")
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            for sub_request, postproc in zip(sub_requests, originals):
+                sub_request.postproc = postproc
+            with self.lock:
+                self.calls.append({"method": method, "params": params, "status": received["status"] or 200,
+                                   "bytes": received["bytes"], "latency": latency})
+        return response
+
+    def summary(self):
+        """
+        Print API calls, calls per method and time per phase (to stderr, so that --format output stays clean).
+        """
+        if self.calls:
+            table = list()
+            for i, call in enumerate(self.calls):
+                params = "\n".join(f"{key}={short(value)}" for key, value in call["params"].items())
+                table.append([i + 1, call["method"], params, call["status"], call["bytes"],
+                              f"{call['latency'] * 1000:.1f}"])
+            print(tabulate(table, ["#", "API call", "Parameters", "Status", "Bytes", "ms"], tablefmt="pretty",
+                           stralign="left"), file=sys.stderr)
+
+            methods = dict()
+            for call in self.calls:
+                stats = methods.setdefault(call["method"], [0, 0, 0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += not str(call["status"]).startswith("2")
+                stats[2] += call["bytes"]
+                stats[3] += call["latency"]
+                stats[4] = max(stats[4], call["latency"])
+            table = [[method, n, errors, size, f"{total * 1000:.1f}", f"{total / n * 1000:.1f}",
+                      f"{worst * 1000:.1f}"]
+                     for method, (n, errors, size, total, worst) in sorted(methods.items(), key=lambda x: -x[1][3])]
+            print(tabulate(table, ["API method", "Calls", "Errors", "Bytes", "Total ms", "Mean ms", "Max ms"],
+                           tablefmt="pretty", stralign="left"), file=sys.stderr)
+        else:
+            print("No Google API calls.", file=sys.stderr)
+
+        wall = time.perf_counter() - self.start
+        phases = sorted(self.phases.items(), key=lambda x: -x[1])
+        phases.append(("other", max(0.0, wall - sum(self.phases.values()))))
+        table = [[name, f"{seconds * 1000:.1f}", f"{100 * seconds / wall:.1f}" if wall else ""]
+                 for name, seconds in phases]
+        table.append(["total", f"{wall * 1000:.1f}", "100.0"])
+        print(tabulate(table, ["Phase", "ms", "%"], tablefmt="pretty", stralign="left"), file=sys.stderr)
+
+    def stop(self):
+        """
+        Stop profiling, print summary and write cProfile stats.
+        """
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.summary()
+        if self.cprofile is not None:
+            try:
+                self.cprofile.dump_stats(self.stats_file)
+                print(f"cProfile stats written to {self.stats_file} (view with: python -m pstats {self.stats_file})",
+                      file=sys.stderr)
+            except OSError as err:
+                print(f"Could not write cProfile stats {self.stats_file}: {err}", file=sys.stderr)
+
+
+def start_profiling(stats_file=None):
+    """
+    Start recording API calls and phases (once per run, the next call only adds stats_file).
+    :param stats_file: str (path), also write cProfile stats to this file
+    :return: Profiler
+    """
+    global profiler
+    if profiler is None:
+        profiler = Profiler(stats_file=stats_file)
+    elif stats_file:
+        profiler.enable_cprofile(stats_file)
+    return profiler
+
+
+def stop_profiling():
+    """
+    Print summary of the active profiler (if any) and stop it.
+    """
+    global profiler
+    active, profiler = profiler, None
+    if active is not None:
+        active.stop()
+
+
+def phase(name):
+    """
+    :param name: str
+    :return: context manager timing phase name (does nothing when not profiling)
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
+
+
+def timed(name):
+    """
+    Decorator timing calls of the decorated function as phase name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_request(request, execute):
+    """
+    Execute request with execute(), recorded if profiling.
+    :return: response
+    """
+    if profiler is None:
+        return execute()
+    return profiler.trace(request, execute)
@@ -0,0 +1,368 @@
+"""RT_ics.py: Export and import of RT rosters and calendar events as iCalendar (.ics, RFC 5545) files."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import os
+from datetime import datetime, timedelta, timezone
+from .static_methods import week_to_date
+
+prodid = "-//UiT The Arctic University of Norway//cliNRIS//EN"
+
+# Google calendar responseStatus <-> iCalendar PARTSTAT
+partstat = {"needsAction": "NEEDS-ACTION", "accepted": "ACCEPTED", "declined": "DECLINED", "tentative": "TENTATIVE"}
+response_status = {value: key for key, value in partstat.items()}
+
+
+def escape(text):
+    """
+    :param text: str
+    :return: str, escaped as iCalendar TEXT value
+    """
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def unescape(text):
+    """
+    :param text: str, iCalendar TEXT value
+    :return: str
+    """
+    result = list()
+    i = 0
+    while i < len(text):
+        if text[i] == "\\" and i + 1 < len(text):
+            result.append("\n" if text[i + 1] in "nN" else text[i + 1])
+            i += 2
+        else:
+            result.append(text[i])
+            i += 1
+    return "".join(result)
+
+
+def param_value(value):
+    """
+    Quote parameter value if it contains characters with meaning in a content line.
+    """
+    value = str(value).replace('"', "'")
+    if any(char in value for char in ",;:"):
+        return f'"{value}"'
+    return value
+
+
+def fold(line):
+    """
+    Fold content line in lines of max 75 octets (RFC 5545 3.1), without splitting UTF-8 characters.
+    :param line: str
+    :return: str ending with CRLF
+    """
+    folded = list()
+    current = ""
+    size = 0
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > 75:
+            folded.append(current)
+            current = " "
+            size = 1
+        current += char
+        size += char_size
+    folded.append(current)
+    return "\r\n".join(folded) + "\r\n"
+
+
+def ics_time(value):
+    """
+    :param value: str, date (year-month-day) or RFC 3339 time from Google calendar
+    :return: property parameters and value for DTSTART/DTEND
+    """
+    if len(value) == 10:
+        return ";VALUE=DATE", value.replace("-", "")
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        return "", moment.strftime("%Y%m%dT%H%M%S")
+    return "", moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def dtstamp():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def shift_summary(names, institution="UiT", ukevakt=False):
+    """
+    Summary of a RT shift event (as RTCalendar.shift_body).
+    """
+    uv = ""
+    if ukevakt:
+        uv = " (ukevakt)"
+    return f'{institution}: {"/".join(names)}{uv}'
+
+
+def shift_uid(shift):
+    """
+    Same UID for the same shift in every export, so that calendars update the shift on re-import.
+    """
+    return f"rt-{shift['institution']}-{shift['year']}-W{int(shift['week']):02d}@clinris".lower()
+
+
+def attendee_line(email, name=None, status="needsAction"):
+    params = ""
+    if name:
+        params += f";CN={param_value(name)}"
+    return f"ATTENDEE{params};ROLE=REQ-PARTICIPANT;PARTSTAT={partstat.get(status, 'NEEDS-ACTION')}:mailto:{email}"
+
+
+def shift_lines(shift, stamp=None):
+    """
+    VEVENT for a RT shift: all-day event monday-friday in week (as RTCalendar.shift_body).
+    :param shift: dict with add_shift arguments (week, year, names, emails, institution, ukevakt)
+    :param stamp: str, DTSTAMP (default: now)
+    :return: list with content lines
+    """
+    first_day = week_to_date(int(shift["year"]), int(shift["week"]))[0]
+    lines = ["BEGIN:VEVENT",
+             f"UID:{shift_uid(shift)}",
+             f"DTSTAMP:{stamp or dtstamp()}",
+             f"DTSTART;VALUE=DATE:{first_day.strftime('%Y%m%d')}",
+             f"DTEND;VALUE=DATE:{(first_day + timedelta(days=5)).strftime('%Y%m%d')}",
+             f"SUMMARY:{escape(shift_summary(shift['names'], shift['institution'], shift['ukevakt']))}",
+             "TRANSP:TRANSPARENT"]
+    names = list(shift["names"])
+    for i, email in enumerate(shift.get("emails") or []):
+        if email:
+            lines.append(attendee_line(email, name=names[i] if i < len(names) else None))
+    lines.append("END:VEVENT")
+    return lines
+
+
+def event_lines(event, stamp=None):
+    """
+    VEVENT for an event from Google calendar (e.g. from RTCalendar.get_events).
+    :param event: dict
+    :param stamp: str, DTSTAMP (default: now)
+    :return: list with content lines
+    """
+    start_params, start = ics_time(event["start"].get("dateTime", event["start"].get("date")))
+    end_params, end = ics_time(event["end"].get("dateTime", event["end"].get("date")))
+    lines = ["BEGIN:VEVENT",
+             f"UID:{event.get('iCalUID') or event['id'] + '@google.com'}",
+             f"DTSTAMP:{stamp or dtstamp()}",
+             f"DTSTART{start_params}:{start}",
+             f"DTEND{end_params}:{end}",
+             f"SUMMARY:{escape(event.get('summary', ''))}"]
+    if event.get("calendar"):
+        lines.append(f"CATEGORIES:{escape(event['calendar'])}")
+    for who in event.get("attendees", []):
+        if who.get("email"):
+            lines.append(attendee_line(who["email"], name=who.get("displayName"),
+                                       status=who.get("responseStatus", "needsAction")))
+    lines.append("END:VEVENT")
+    return lines
+
+
+def calendar_text(vevents, name=None):
+    """
+    VCALENDAR with vevents, as a generator of folded text (one event at a time, for streaming).
+    :param vevents: iterable with VEVENT content lines (lists, see shift_lines and event_lines)
+    :param name: str, calendar name (X-WR-CALNAME)
+    :return: generator with str
+    """
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{prodid}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH"]
+    if name:
+        header.append(f"X-WR-CALNAME:{escape(name)}")
+    yield "".join(map(fold, header))
+    for lines in vevents:
+        yield "".join(map(fold, lines))
+    yield fold("END:VCALENDAR")
+
+
+def events_to_ics(events, name=None):
+    """
+    :param events: iterable with Google calendar events
+    :param name: str, calendar name
+    :return: generator with str (see calendar_text)
+    """
+    stamp = dtstamp()
+    return calendar_text((event_lines(event, stamp=stamp) for event in events), name=name)
+
+
+def rost_shifts(rost, year, institution="UiT"):
+    """
+    :param rost: dict, roster from make_roster.populate_rost {week: {"who": [...], "email": [...], "ukevakt": bool}}
+    :param year: int
+    :param institution: str
+    :return: list with shifts (dicts with add_shift arguments)
+    """
+    return [{"week": week, "year": year, "names": list(rost[week]["who"]), "emails": list(rost[week]["email"]),
+             "institution": institution, "ukevakt": rost[week]["ukevakt"]} for week in sorted(rost.keys())]
+
+
+def write_ics(filename, shifts, name=None):
+    """
+    Write shifts to one .ics file (atomic).
+    :param filename: str (path)
+    :param shifts: list with shifts (see rost_shifts, or add_shift.roster_shifts for roster csv files)
+    :param name: str, calendar name
+    """
+    stamp = dtstamp()
+    tmp_file = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", newline="", encoding="utf-8") as ics:
+        for text in calendar_text((shift_lines(shift, stamp=stamp) for shift in shifts), name=name):
+            ics.write(text)
+    os.replace(tmp_file, filename)
+
+
+def parse_line(line):
+    """
+    :param line: str, unfolded content line
+    :return: name (upper case), dict with parameters, value
+    """
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return line.upper(), dict(), ""
+
+    parts = list()
+    current = ""
+    quoted = False
+    for char in head:
+        if char == '"':
+            quoted = not quoted
+        elif char == ";" and not quoted:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    parts.append(current)
+
+    params = dict()
+    for part in parts[1:]:
+        key, _, param = part.partition("=")
+        params[key.upper()] = param.strip('"')
+    return parts[0].upper(), params, value
+
+
+def read_ics(filename):
+    """
+    Events in .ics file.
+    :param filename: str (path)
+    :return: list with dicts {property name: [(params, value), ...]} for each VEVENT
+    """
+    with open(filename, "r", encoding="utf-8-sig", newline="") as ics:
+        lines = list()
+        for line in ics.read().splitlines():
+            if line[:1] in (" ", "\t") and lines:
+                lines[-1] += line[1:]
+            elif line:
+                lines.append(line)
+
+    events = list()
+    event = None
+    depth = 0
+    for line in lines:
+        name, params, value = parse_line(line)
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = dict()
+            depth = 0
+        elif event is not None and name == "BEGIN":
+            # Sub components (VALARM...) are skipped
+            depth += 1
+        elif event is not None and name == "END" and depth:
+            depth -= 1
+        elif event is not None and name == "END" and value.upper() == "VEVENT":
+            events.append(event)
+            event = None
+        elif event is not None and not depth:
+            event.setdefault(name, list()).append((params, value))
+    return events
+
+
+def ics_date(value):
+    """
+    :param value: str, DATE or DATE-TIME value
+    :return: date
+    """
+    return datetime.strptime(value[:8], "%Y%m%d").date()
+
+
+def ics_shifts(filename):
+    """
+    RT shifts in .ics file (written by write_ics, or exported from Google calendar).
+    :param filename: str (path)
+    :return: list with shifts (dicts with add_shift arguments), sorted by year and week
+    """
+    shifts = list()
+    for event in read_ics(filename):
+        if "DTSTART" not in event:
+            continue
+        first_day = ics_date(event["DTSTART"][0][1])
+        summary = unescape(event.get("SUMMARY", [({}, "")])[0][1])
+
+        institution = "UiT"
+        names = summary
+        if ":" in summary:
+            institution, names = [part.strip() for part in summary.split(":", 1)]
+        ukevakt = "(ukevakt)" in names
+        names = [name.strip() for name in names.replace("(ukevakt)", "").split("/") if name.strip()]
+
+        emails = list()
+        attendee_names = list()
+        for params, value in event.get("ATTENDEE", []):
+            emails.append(value.split(":", 1)[-1] if value.lower().startswith("mailto:") else value)
+            attendee_names.append(params.get("CN"))
+        if attendee_names and all(attendee_names):
+            names = attendee_names
+
+        shifts.append({"week": int(first_day.strftime("%W")), "year": first_day.year, "names": names,
+                       "emails": emails, "institution": institution, "ukevakt": ukevakt})
+    return sorted(shifts, key=lambda shift: (shift["year"], shift["week"]))
+
+
+def shifts_to_rosts(shifts):
+    """
+    :param shifts: list with shifts (see ics_shifts)
+    :return: dict {year: rost} with rosts as from make_roster.populate_rost
+    """
+    rosts = dict()
+    for shift in shifts:
+        rost = rosts.setdefault(shift["year"], dict())
+        rost[shift["week"]] = {"who": list(shift["names"]), "email": list(shift["emails"]),
+                               "ukevakt": shift["ukevakt"]}
+    return rosts
+
+
+def read_roster_ics(filename):
+    """
+    Roster in .ics file as read_roster_csv reads a roster csv file (from make_roster), so that add_shift can use
+    both. The file must contain shifts from one year and institution.
+    :param filename: str (path)
+    :return: title, header, table
+    """
+    shifts = ics_shifts(filename)
+    if not shifts:
+        raise SystemExit(f"ABORTING: Found no events in {filename}.")
+    years = sorted(set(shift["year"] for shift in shifts))
+    institutions = sorted(set(shift["institution"] for shift in shifts))
+    if len(years) > 1 or len(institutions) > 1:
+        raise SystemExit(f"ABORTING: {filename} has shifts in years {', '.join(map(str, years))} for "
+                         f"{', '.join(institutions)}. Use one file per year and institution.")
+
+    header = ["Week", "From", "To", "Who", "Ukevakt", "email"]
+    table = list()
+    for shift in shifts:
+        d1, d2 = week_to_date(shift["year"], shift["week"])
+        table.append([str(shift["week"]), str(d1), str(d2), "/".join(shift["names"]),
+                      "X" if shift["ukevakt"] else " ", "/".join(shift["emails"])])
+    title = f"{institutions[0]} RT SUPPORT weeks {shifts[0]['week']} - {shifts[-1]['week']} {years[0]}"
+    return title, header, table
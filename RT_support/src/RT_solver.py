@@ -0,0 +1,623 @@
+"""RT_solver.py: Exact fair-share roster engine (min-cost flow), alternative to the greedy make_roster.populate_rost,
+the fairness objective used to compare rosters and local search improving a roster."""
+
+__author__ = "Geir Villy Isaksen"
+__copyright__ = "Copyright 2021, Geir Villy Isaksen, UiT The Arctic University of Norway"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "Geir Villy Isaksen"
+__email__ = "geir.isaksen@uit.no"
+__status__ = "Production"
+
+import bisect
+import math
+import random
+import time
+from collections import deque
+
+# Costs are scaled to integers, so that the flow algorithm is exact (no rounding in comparisons)
+cost_scale = 10 ** 6
+
+
+class MinCostFlow:
+    """
+    Min-cost flow with successive shortest paths (Bellman-Ford/SPFA, costs may be negative).
+    Arcs to the sink can have convex costs: a function giving the cost of the next unit of flow, so that a convex
+    cost of n units is one arc instead of n parallel arcs.
+    """
+    def __init__(self, nodes):
+        """
+        :param nodes: int, number of nodes (0 ... nodes-1)
+        """
+        self.nodes = nodes
+        # Arcs: [to, capacity, cost, reverse arc index, convex cost function or None, flow]
+        self.graph = [list() for _ in range(nodes)]
+
+    def add_arc(self, u, v, capacity, cost=0, convex=None):
+        """
+        :param u: int, from node
+        :param v: int, to node
+        :param capacity: int
+        :param cost: int, cost per unit (ignored for convex arcs)
+        :param convex: function(k) -> int, cost of unit number k + 1 (increasing in k)
+        """
+        self.graph[u].append([v, capacity, cost, len(self.graph[v]), convex, 0])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1, None, 0])
+
+    def residual_cost(self, u, arc):
+        v, capacity, cost, rev, convex, flow = arc
+        if convex is not None:
+            return convex(flow)
+        reverse = self.graph[v][rev]
+        if reverse[4] is not None:
+            # Undo the last unit of a convex arc
+            return -reverse[4](reverse[5] - 1)
+        return cost
+
+    def residual(self, arc):
+        v, capacity, cost, rev, convex, flow = arc
+        if convex is not None:
+            return capacity - flow
+        reverse = self.graph[v][rev]
+        if reverse[4] is not None:
+            return reverse[5]
+        return capacity
+
+    def push(self, u, i, amount):
+        arc = self.graph[u][i]
+        reverse = self.graph[arc[0]][arc[3]]
+        if arc[4] is not None:
+            arc[5] += amount
+        elif reverse[4] is not None:
+            reverse[5] -= amount
+        else:
+            arc[1] -= amount
+            reverse[1] += amount
+
+    def solve(self, source, sink, flow):
+        """
+        Send flow units from source to sink at minimum cost.
+        :return: units sent (less than flow if the network can not carry it), total cost
+        """
+        sent = 0
+        total = 0
+        while sent < flow:
+            distance = [math.inf] * self.nodes
+            previous = [None] * self.nodes
+            in_queue = [False] * self.nodes
+            distance[source] = 0
+            queue = deque([source])
+            while queue:
+                u = queue.popleft()
+                in_queue[u] = False
+                for i, arc in enumerate(self.graph[u]):
+                    if self.residual(arc) <= 0:
+                        continue
+                    d = distance[u] + self.residual_cost(u, arc)
+                    if d < distance[arc[0]]:
+                        distance[arc[0]] = d
+                        previous[arc[0]] = (u, i)
+                        if not in_queue[arc[0]]:
+                            in_queue[arc[0]] = True
+                            queue.append(arc[0])
+            if distance[sink] == math.inf:
+                break
+
+            # One unit at a time when the path has convex arcs, otherwise the bottleneck
+            amount = flow - sent
+            v = sink
+            while v != source:
+                u, i = previous[v]
+                arc = self.graph[u][i]
+                reverse = self.graph[arc[0]][arc[3]]
+                if arc[4] is not None or reverse[4] is not None:
+                    amount = 1
+                amount = min(amount, self.residual(arc))
+                v = u
+            v = sink
+            while v != source:
+                u, i = previous[v]
+                self.push(u, i, amount)
+                v = u
+            sent += amount
+            total += amount * distance[sink]
+        return sent, total
+
+
+def targets(staff, weeks):
+    """
+    Fair load of each staff member: weeks shared in proportion to frequency.
+    :param staff: dict {name: StaffMember}
+    :param weeks: int
+    :return: dict {name: load (weeks)}
+    """
+    total = sum(member.frequency for member in staff.values())
+    if total <= 0:
+        raise SystemExit("ABORTING: All staff members have frequency 0.")
+    return {name: weeks * member.frequency / total for name, member in staff.items()}
+
+
+def allocate(names, target, unit, classes, eligible):
+    """
+    Exact allocation of seats in week classes (e.g. ukevakt / other weeks) to staff, minimizing the sum of
+    (load - target)^2, as a min-cost flow: source -> class (seats) -> staff member (eligible) -> sink (convex cost).
+    :param names: list with names
+    :param target: dict {name: load}
+    :param unit: float, load of one seat (1 for a whole week, 0.5 for a shared week)
+    :param classes: list with (seats, max seats per staff member) for each class
+    :param eligible: function(name, class index) -> bool
+    :return: dict {name: [seats in each class]} and cost, or None if the seats can not be filled
+    """
+    source, sink = 0, 1
+    first_class = 2
+    first_name = first_class + len(classes)
+    network = MinCostFlow(first_name + len(names))
+
+    for c, (seats, per_member) in enumerate(classes):
+        network.add_arc(source, first_class + c, seats)
+        for n, name in enumerate(names):
+            if eligible(name, c):
+                network.add_arc(first_class + c, first_name + n, per_member)
+
+    for n, name in enumerate(names):
+        def marginal(k, t=target[name]):
+            # (load - target)^2 increases by this with seat k + 1
+            return round(cost_scale * (unit * unit * (2 * k + 1) - 2 * unit * t))
+        network.add_arc(first_name + n, sink, sum(seats for seats, per_member in classes), convex=marginal)
+
+    seats = sum(seats for seats, per_member in classes)
+    sent, cost = network.solve(source, sink, seats)
+    if sent < seats:
+        return None
+
+    allocation = {name: [0] * len(classes) for name in names}
+    for c in range(len(classes)):
+        for arc in network.graph[first_class + c]:
+            if first_name <= arc[0] < first_name + len(names):
+                reverse = network.graph[arc[0]][arc[3]]
+                allocation[names[arc[0] - first_name]][c] += reverse[1]
+    return allocation, cost
+
+
+def convex_minimum(cost, start, low, high):
+    """
+    Minimum of a convex function of integers, walking from start (searching all values if start is infeasible).
+    :param cost: function(int) -> cost (math.inf if infeasible)
+    :param start: int
+    :param low: int
+    :param high: int
+    :return: int
+    """
+    x = min(high, max(low, start))
+    if cost(x) == math.inf:
+        feasible = [y for y in range(low, high + 1) if cost(y) < math.inf]
+        if not feasible:
+            return x
+        x = min(feasible, key=cost)
+    for step in (-1, 1):
+        while low <= x + step <= high and cost(x + step) < cost(x):
+            x += step
+    return x
+
+
+def solve_counts(staff, n_weeks, n_ukevakt):
+    """
+    Number of shifts of each staff member, minimizing the sum of (load - target)^2 over staff where target is the
+    fair share of the weeks (see targets), load counts a shared week as 0.5.
+    Each week has one staff member that does not share, or two that share (if at least two staff members share).
+    Ukevakt weeks only go to staff members with ukevakt. The number of shared weeks (and of ukevakt weeks among them)
+    is searched with convex_minimum, each evaluated exactly with allocate.
+    :param staff: dict {name: StaffMember}
+    :param n_weeks: int
+    :param n_ukevakt: int, weeks with ukevakt
+    :return: dict with shared weeks "shared", shared ukevakt weeks "shared_ukevakt", and seats per staff member
+    {"single": {name: [ukevakt, other]}, "pairs": {name: [ukevakt, other]}}, objective
+    """
+    target = targets(staff, n_weeks)
+    singles = [name for name, member in staff.items() if not member.shared]
+    sharing = [name for name, member in staff.items() if member.shared]
+    if len(sharing) < 2:
+        # Nobody to share with, they take whole weeks
+        singles, sharing = singles + sharing, list()
+
+    def eligible(name, c):
+        return c == 1 or staff[name].ukevakt
+
+    def evaluate(shared, shared_ukevakt):
+        single_ukevakt = n_ukevakt - shared_ukevakt
+        single_other = n_weeks - shared - single_ukevakt
+        if single_other < 0 or shared - shared_ukevakt < 0 or (not singles and n_weeks - shared > 0):
+            return None
+        single = allocate(singles, target, 1.0, [(single_ukevakt, single_ukevakt), (single_other, single_other)],
+                          eligible) if singles else ({}, 0)
+        if single is None:
+            return None
+        pairs = allocate(sharing, target, 0.5, [(2 * shared_ukevakt, shared_ukevakt),
+                                                (2 * (shared - shared_ukevakt), shared - shared_ukevakt)],
+                         eligible) if sharing else ({}, 0)
+        if pairs is None:
+            return None
+        return ({"shared": shared, "shared_ukevakt": shared_ukevakt, "single": single[0], "pairs": pairs[0]},
+                single[1] + pairs[1])
+
+    evaluated = dict()
+
+    def best_split(shared):
+        # Ukevakt weeks among the shared weeks, from ukevakt weeks in proportion to shared weeks
+        if shared not in evaluated:
+            splits = dict()
+
+            def cost(split):
+                if split not in splits:
+                    splits[split] = evaluate(shared, split)
+                return math.inf if splits[split] is None else splits[split][1]
+            proportional = round(n_ukevakt * shared / n_weeks) if n_weeks else 0
+            split = convex_minimum(cost, proportional, 0, min(n_ukevakt, shared))
+            evaluated[shared] = splits.get(split)
+        return evaluated[shared]
+
+    def cost(shared):
+        result = best_split(shared)
+        return math.inf if result is None else result[1]
+
+    shared = 0
+    if sharing:
+        shared = convex_minimum(cost, round(sum(target[name] for name in sharing)), 0, n_weeks)
+
+    result = best_split(shared)
+    if result is None:
+        raise SystemExit("ABORTING: Found no roster where all weeks (and ukevakt weeks) can be filled.")
+    counts, flow_cost = result
+    # The flow cost is the increase of (load - target)^2 from load 0
+    return counts, flow_cost / cost_scale + sum(t * t for t in target.values())
+
+
+def spread(weeks, quota, per_week, order):
+    """
+    Place staff in weeks so that each staff member's weeks are evenly spread (earliest due first).
+    :param weeks: list with week numbers (of one kind, e.g. shared ukevakt weeks)
+    :param quota: dict {name: weeks}
+    :param per_week: int, staff members per week
+    :param order: list with names (tie break)
+    :return: dict {week: [names]}
+    """
+    remaining = dict(quota)
+    spacing = {name: len(weeks) / count for name, count in quota.items() if count}
+    due = {name: spacing[name] / 2 for name in spacing}
+    rank = {name: i for i, name in enumerate(order)}
+    placed = dict()
+    previous = list()
+    for i, week in enumerate(weeks):
+        left = len(weeks) - i
+        candidates = [name for name in remaining if remaining[name] > 0]
+        # Staff members that must be in every remaining week come first, then earliest due (not last week)
+        candidates.sort(key=lambda name: (remaining[name] < left, name in previous, due[name], rank[name]))
+        chosen = candidates[:per_week]
+        for name in chosen:
+            remaining[name] -= 1
+            due[name] += spacing[name]
+        placed[week] = chosen
+        previous = chosen
+    return placed
+
+
+def spaced(weeks, n):
+    """
+    :return: n of weeks, evenly spread
+    """
+    if n <= 0:
+        return list()
+    return [weeks[int((k + 0.5) * len(weeks) / n)] for k in range(n)]
+
+
+def solve_rost(from_week, to_week, seed, ukevakt, staff):
+    """
+    Roster from from_week to to_week where the load of each staff member matches frequency as closely as possible
+    (see solve_counts), honoring ukevakt and shared. Same arguments and roster as make_roster.populate_rost.
+    :param from_week: int
+    :param to_week: int
+    :param seed: int, order of staff for ties
+    :param ukevakt: list (week numbers with ukevakt)
+    :param staff: dict {name: StaffMember}
+    :return: dict (roster) and int (rounds)
+    """
+    weeks = list(range(from_week, to_week + 1))
+    ukevakt_weeks = [week for week in weeks if week in ukevakt]
+    other_weeks = [week for week in weeks if week not in ukevakt]
+    counts, deviation = solve_counts(staff, len(weeks), len(ukevakt_weeks))
+
+    random.seed(seed)
+    order = random.sample(list(staff.keys()), len(staff))
+
+    shared_ukevakt = spaced(ukevakt_weeks, counts["shared_ukevakt"])
+    shared_other = spaced(other_weeks, counts["shared"] - counts["shared_ukevakt"])
+    placed = dict()
+    for kind, kind_weeks, per_week, allocation in [
+            (0, [week for week in ukevakt_weeks if week not in shared_ukevakt], 1, counts["single"]),
+            (1, [week for week in other_weeks if week not in shared_other], 1, counts["single"]),
+            (0, shared_ukevakt, 2, counts["pairs"]),
+            (1, shared_other, 2, counts["pairs"])]:
+        quota = {name: seats[kind] for name, seats in allocation.items()}
+        placed.update(spread(kind_weeks, quota, per_week, order))
+
+    rost = dict()
+    shifts_total = 0
+    for week in weeks:
+        rost[week] = {"who": list(placed[week]), "email": [staff[name].email for name in placed[week]],
+                      "ukevakt": week in ukevakt}
+        shifts_total += len(placed[week])
+
+    rounds = max(1, round(shifts_total / sum(member.frequency for member in staff.values())))
+    return rost, rounds
+
+
+def load_deviation(rost, staff):
+    """
+    Sum of (load - target)^2 over staff (see targets), a shared week is half a week of load.
+    :param rost: dict (roster)
+    :param staff: dict {name: StaffMember}
+    :return: float
+    """
+    load = {name: 0.0 for name in staff}
+    for week in rost.values():
+        for name in week["who"]:
+            load[name] = load.get(name, 0.0) + 1 / len(week["who"])
+    target = targets(staff, len(rost))
+    return sum((load[name] - target.get(name, 0.0)) ** 2 for name in load)
+
+
+# Weights of the terms in the fairness objective (see Fairness)
+fairness_weights = {"load": 1.0, "ukevakt": 1.0, "gaps": 1.0}
+
+
+def staff_shifts(rost):
+    """
+    :param rost: dict (roster)
+    :return: dict {name: [(week, load, ukevakt)]} sorted by week, load is 0.5 for a shared week
+    """
+    shifts = dict()
+    for week in sorted(rost.keys()):
+        for name in rost[week]["who"]:
+            shifts.setdefault(name, list()).append((week, 1 / len(rost[week]["who"]), rost[week]["ukevakt"]))
+    return shifts
+
+
+class Fairness:
+    """
+    Fairness objective of rosters (lower is better), a sum of terms for each staff member:
+    load: (load - fair share of the weeks)^2, fair share in proportion to frequency (see targets)
+    ukevakt: (ukevakt load - fair share of the ukevakt weeks among staff with ukevakt)^2
+    gaps: (1 - gap / ideal gap)^2 for each gap between two shifts shorter than the ideal gap (weeks / fair shifts)
+    Each term only depends on the shifts of one staff member, so a change of the roster can be scored from the
+    staff members it touches.
+    """
+    def __init__(self, staff, weeks, ukevakt, weights=None):
+        """
+        :param staff: dict {name: StaffMember}
+        :param weeks: int, weeks in roster
+        :param ukevakt: int, ukevakt weeks in roster
+        :param weights: dict with weights of load, ukevakt and gaps (default: fairness_weights)
+        """
+        self.weights = dict(fairness_weights, **(weights or dict()))
+        self.target = targets(staff, weeks)
+
+        eligible = sum(member.frequency for member in staff.values() if member.ukevakt)
+        self.ukevakt_target = {name: ukevakt * member.frequency / eligible if member.ukevakt and eligible else 0.0
+                               for name, member in staff.items()}
+
+        sharing = len([member for member in staff.values() if member.shared]) > 1
+        self.ideal_gap = dict()
+        for name, member in staff.items():
+            fair_shifts = self.target[name] * (2 if sharing and member.shared else 1)
+            self.ideal_gap[name] = weeks / fair_shifts if fair_shifts > 1 else weeks
+
+    @classmethod
+    def of_rost(cls, rost, staff, weights=None):
+        return cls(staff, len(rost), len([week for week in rost.values() if week["ukevakt"]]), weights=weights)
+
+    def terms(self, name, shifts):
+        """
+        :param name: str
+        :param shifts: list with (week, load, ukevakt) of name, sorted by week (see staff_shifts)
+        :return: dict with the (weighted) load, ukevakt and gaps terms of name
+        """
+        load = sum(unit for week, unit, ukevakt in shifts)
+        ukevakt_load = sum(unit for week, unit, ukevakt in shifts if ukevakt)
+        ideal = self.ideal_gap.get(name, 1)
+        gaps = 0.0
+        for (week, unit, ukevakt), (next_week, next_unit, next_ukevakt) in zip(shifts, shifts[1:]):
+            if next_week - week < ideal:
+                gaps += (1 - (next_week - week) / ideal) ** 2
+        return {"load": self.weights["load"] * (load - self.target.get(name, 0.0)) ** 2,
+                "ukevakt": self.weights["ukevakt"] * (ukevakt_load - self.ukevakt_target.get(name, 0.0)) ** 2,
+                "gaps": self.weights["gaps"] * gaps}
+
+    def cost(self, name, shifts):
+        """
+        :return: float, sum of the terms of name
+        """
+        return sum(self.terms(name, shifts).values())
+
+    def breakdown(self, rost):
+        """
+        :param rost: dict (roster)
+        :return: dict with the load, ukevakt and gaps terms summed over staff
+        """
+        shifts = staff_shifts(rost)
+        total = {"load": 0.0, "ukevakt": 0.0, "gaps": 0.0}
+        for name in set(self.target) | set(shifts):
+            for term, value in self.terms(name, shifts.get(name, list())).items():
+                total[term] += value
+        return total
+
+    def score(self, rost):
+        """
+        :param rost: dict (roster)
+        :return: float, fairness objective of rost (lower is better)
+        """
+        return sum(self.breakdown(rost).values())
+
+
+def without_week(shifts, week):
+    """
+    :param shifts: list with (week, load, ukevakt) sorted by week
+    :return: copy of shifts without week
+    """
+    return [shift for shift in shifts if shift[0] != week]
+
+
+def with_shift(shifts, shift):
+    """
+    :param shifts: list with (week, load, ukevakt) sorted by week
+    :param shift: (week, load, ukevakt)
+    :return: copy of shifts with shift (sorted)
+    """
+    shifts = list(shifts)
+    bisect.insort(shifts, shift)
+    return shifts
+
+
+def improve_rost(rost, staff, seconds, seed=None, weights=None):
+    """
+    Local search on rost (changed in place) lowering the Fairness score, until seconds have passed or no move
+    improves it (local optimum). Moves: another staff member takes a shift, two shifts in different weeks are
+    swapped, a shared week is taken by one staff member that does not share (split), or a week of one staff member
+    is taken by two that share (merge). Ukevakt weeks only go to staff with ukevakt, and a staff member that shares
+    only replaces one that shares (and the other way around). A move is scored from the terms of the staff members
+    it touches. A week with the same staff member twice (possible in greedy rosters) is first given to that staff
+    member alone: the same load, without the gap of a shift next to itself.
+    :param rost: dict (roster)
+    :param staff: dict {name: StaffMember}
+    :param seconds: float, time budget
+    :param seed: int, seed for the order moves are tried in
+    :param weights: dict with weights of the Fairness terms
+    :return: dict with score before and after, weeks repaired (same staff member twice), moves tried, improving
+    moves, seconds used and local_optimum (bool, False if the time budget was used or no move is allowed)
+    """
+    start = time.perf_counter()
+    fairness = Fairness.of_rost(rost, staff, weights=weights)
+    before = fairness.score(rost)
+    repaired = 0
+    for week in rost.values():
+        if len(set(week["who"])) < len(week["who"]):
+            unique = [week["who"].index(name) for name in dict.fromkeys(week["who"])]
+            week["who"] = [week["who"][i] for i in unique]
+            week["email"] = [week["email"][i] for i in unique]
+            repaired += 1
+
+    shifts = staff_shifts(rost)
+    for name in staff:
+        shifts.setdefault(name, list())
+    cost = {name: fairness.cost(name, shifts[name]) for name in shifts}
+    stats = {"before": before, "after": None, "repaired": repaired, "moves": 0, "improvements": 0, "seconds": 0.0,
+             "local_optimum": False}
+
+    sharing = len([member for member in staff.values() if member.shared]) > 1
+    names = sorted(staff.keys())
+    singles = [name for name in names if not sharing or not staff[name].shared]
+    pairs = [(a, b) for i, a in enumerate(names) for b in names[i + 1:]
+             if sharing and staff[a].shared and staff[b].shared]
+    rng = random.Random(seed)
+
+    def allowed(name, week, replaced):
+        if name in rost[week]["who"] or name not in staff:
+            return False
+        if rost[week]["ukevakt"] and not staff[name].ukevakt:
+            return False
+        return not sharing or replaced not in staff or staff[name].shared == staff[replaced].shared
+
+    def shift(week):
+        return week, 1 / len(rost[week]["who"]), rost[week]["ukevakt"]
+
+    def assign(week, slot, name):
+        rost[week]["who"][slot] = name
+        rost[week]["email"][slot] = staff[name].email
+
+    def set_week(week, who):
+        rost[week]["who"] = list(who)
+        rost[week]["email"] = [staff[name].email for name in who]
+
+    def eligible(name, week):
+        return name in staff and (staff[name].ukevakt or not rost[week]["ukevakt"])
+
+    def try_move(week, slot, name):
+        replaced = rost[week]["who"][slot]
+        if not allowed(name, week, replaced):
+            return False
+        new = {replaced: without_week(shifts[replaced], week), name: with_shift(shifts[name], shift(week))}
+        return apply(new, lambda: assign(week, slot, name))
+
+    def try_swap(week, slot, other_week, other_slot):
+        a, b = rost[week]["who"][slot], rost[other_week]["who"][other_slot]
+        if week == other_week or a == b or not allowed(b, week, a) or not allowed(a, other_week, b):
+            return False
+        new = {a: with_shift(without_week(shifts[a], week), shift(other_week)),
+               b: with_shift(without_week(shifts[b], other_week), shift(week))}
+
+        def change():
+            assign(week, slot, b)
+            assign(other_week, other_slot, a)
+        return apply(new, change)
+
+    def try_split(week, name):
+        # Two staff members in week -> name alone (that does not share)
+        who = rost[week]["who"]
+        if len(who) != 2 or name in who or not eligible(name, week):
+            return False
+        new = {partner: without_week(shifts[partner], week) for partner in who}
+        new[name] = with_shift(shifts[name], (week, 1.0, rost[week]["ukevakt"]))
+        return apply(new, lambda: set_week(week, [name]))
+
+    def try_merge(week, a, b):
+        # One staff member in week -> a and b sharing it
+        who = rost[week]["who"]
+        if len(who) != 1 or who[0] in (a, b) or not eligible(a, week) or not eligible(b, week):
+            return False
+        new = {who[0]: without_week(shifts[who[0]], week)}
+        for partner in (a, b):
+            new[partner] = with_shift(shifts[partner], (week, 0.5, rost[week]["ukevakt"]))
+        return apply(new, lambda: set_week(week, [a, b]))
+
+    def apply(new, change):
+        stats["moves"] += 1
+        new_cost = {name: fairness.cost(name, new_shifts) for name, new_shifts in new.items()}
+        if sum(new_cost.values()) - sum(cost[name] for name in new) >= -1e-9:
+            return False
+        change()
+        shifts.update(new)
+        cost.update(new_cost)
+        stats["improvements"] += 1
+        return True
+
+    def exists(week, slot):
+        # Splits and merges change the number of staff in a week during a pass
+        return slot < len(rost[week]["who"])
+
+    improved = True
+    while improved and time.perf_counter() - start < seconds:
+        # One pass over all moves, a pass without improvements is a local optimum
+        improved = False
+        positions = [(week, slot) for week in rost for slot in range(len(rost[week]["who"]))]
+        rng.shuffle(positions)
+        for i, (week, slot) in enumerate(positions):
+            if time.perf_counter() - start >= seconds:
+                break
+            if not exists(week, slot):
+                continue
+            for name in rng.sample(names, len(names)):
+                improved |= exists(week, slot) and try_move(week, slot, name)
+            for other_week, other_slot in positions[i + 1:]:
+                if exists(week, slot) and exists(other_week, other_slot):
+                    improved |= try_swap(week, slot, other_week, other_slot)
+            if slot == 0:
+                for name in rng.sample(singles, len(singles)):
+                    improved |= try_split(week, name)
+                for a, b in rng.sample(pairs, len(pairs)):
+                    improved |= try_merge(week, a, b)
+        else:
+            stats["local_optimum"] = not improved and stats["moves"] > 0
+
+    stats["after"] = fairness.score(rost)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
@@ -1,11 +1,18 @@
 import colorful as cf
 import csv
+import json
+import os
+import subprocess
+import time
 from datetime import datetime, timedelta
 
 
 # Static methods
 cf.update_palette({"blue": "#2e54ff", "green": "#08a91e", "orange": "#ff5733"})
 
+# Output formats of RTCalendar.print_rt_events (see set_output). Here, so CLIs can use them without the Google API.
+output_formats = ["grid", "plain", "json", "jsonl", "csv", "tsv", "ics"]
+
 
 def cal_status_color(status):
     """
@@ -69,3 +76,72 @@ def week_to_date(year, week):
     return firstdayofweek, lastdayofweek
 
 
+def date_to_week(day):
+    """
+    Week of a date, with the same week numbers as week_to_date (%W: weeks start on monday, week 1 has the first
+    monday of the year), not ISO weeks.
+    :param day: date
+    :return: year, week
+    """
+    return day.year, int(day.strftime("%W"))
+
+
+def read_json_cache(filepath, ttl=None):
+    """
+    Read a json cache file written by write_json_cache.
+    :param filepath: str
+    :param ttl: int, max age of cache in seconds (None: never expires)
+    :return: cached data, or None if missing, unreadable or expired
+    """
+    if not os.path.isfile(filepath):
+        return None
+    try:
+        with open(filepath, "r") as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if ttl is not None and time.time() - cache.get("created", 0) > ttl:
+        return None
+    return cache.get("data")
+
+
+def write_json_cache(filepath, data):
+    """
+    Write data to json cache file (atomic, so that parallel runs never read a half written file).
+    :param filepath: str
+    :param data: json serializable
+    """
+    tmp_file = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as cache_file:
+        json.dump({"created": time.time(), "data": data}, cache_file)
+    os.replace(tmp_file, filepath)
+
+
+def page(chunks):
+    """
+    Show text in a pager ($PAGER, default: less -R). Chunks are written to the pager as they are produced, so the
+    first page is shown before the last chunk is ready.
+    :param chunks: iterable with str
+    """
+    try:
+        pager = subprocess.Popen(os.environ.get("PAGER", "less -R"), shell=True, stdin=subprocess.PIPE,
+                                 universal_newlines=True)
+    except OSError:
+        for chunk in chunks:
+            print(chunk, end="", flush=True)
+        return
+
+    try:
+        for chunk in chunks:
+            pager.stdin.write(chunk)
+            pager.stdin.flush()
+    except BrokenPipeError:
+        # User quit the pager
+        pass
+    finally:
+        try:
+            pager.stdin.close()
+        except BrokenPipeError:
+            pass
+        pager.wait()
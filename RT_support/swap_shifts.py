@@ -2,16 +2,25 @@
 
 import rt_settings as rt
 import click
-from src.Gcal_API import RTCalendar
+from datetime import datetime
 
 cal = rt.default_cal
 event_id1 = None
 event_id2 = None
+week1 = None
+week2 = None
+year = datetime.now().year
+institution = None
+rotate = None
+rotate_weeks = None
 
 @click.command()
 @click.option(
-    "-c", "--cal", type=click.Choice(rt.cal_choices, case_sensitive=True),
-    default=cal, help=f"Calendar (default: {cal})"
+    "-c", "--cal", type=str,
+    default=cal, help=f"Calendar (default: {cal or 'personal calendar'})"
+)
+@click.option(
+    "--refresh-calendars", is_flag=True, default=False, help="Refresh cached list of available calendars."
 )
 @click.option(
     "-id1", "--event_id1", type=str, default=event_id1, help="ID of first shift with staff to swap with..."
@@ -19,21 +28,56 @@ event_id2 = None
 @click.option(
     "-id2", "--event_id2", type=str, default=event_id2, help="ID of second shift's staff"
 )
-def main(cal, event_id1, event_id2):
+@click.option(
+    "-w1", "--week1", type=int, default=week1,
+    help="Week number of first shift (as in the roster), instead of event ID."
+)
+@click.option(
+    "-w2", "--week2", type=int, default=week2,
+    help="Week number of second shift (as in the roster), instead of event ID."
+)
+@click.option(
+    "-y", "--year", type=int, default=year, help=f"Year for weeks (default: {year})."
+)
+@click.option(
+    "-i", "--institution", type=str, default=institution, help="Institution of shifts, if several in a week."
+)
+@click.option(
+    "-r", "--rotate", type=str, multiple=True, default=rotate,
+    help="Event IDs of shifts to rotate staff between (staff move to the next shift, last to first). Multiple."
+)
+@click.option(
+    "-rw", "--rotate_weeks", type=int, multiple=True, default=rotate_weeks,
+    help="Week numbers of shifts (as in the roster) to rotate staff between, instead of event IDs. Multiple."
+)
+@rt.profile_options
+def main(cal, event_id1, event_id2, week1, week2, year, institution, rotate, rotate_weeks, refresh_calendars):
     """
-    Simple CLI to swap staff between two RT support shifts by event IDs (print_events.py).
+    Simple CLI to swap staff between two RT support shifts by event IDs (print_events.py) or weeks, or rotate
+    staff between several shifts. Either all shifts are changed, or none.
 
     Suggestions, corrections and feedbacks are appreciated: geir.isaksen@uit.no
     """
-    if not event_id1 or not event_id2:
-        print("Missing event IDs. Aborting.")
+    if rotate or rotate_weeks:
+        rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
+        event_ids = list(rotate)
+        for week in rotate_weeks:
+            event_ids.append(rt.resolve_event_id(rt_cal, week=week, year=year, institution=institution))
+        if None in event_ids:
+            return
+        rt_cal.rotate_shifts(event_ids)
         return
-    rt_cal = RTCalendar(calendar_id=rt.avail_cal[cal], scopes=rt.scopes, credentialsfile=rt.secret_file, token=rt.token)
 
-    if cal != rt.default_cal:
-        rt_cal.change_calendar(calendar_name=cal)
+    if not (event_id1 or week1) or not (event_id2 or week2):
+        print("Missing event IDs (or weeks). Aborting.")
+        return
+    rt_cal = rt.open_calendar(cal, refresh_calendars=refresh_calendars)
+    event_id1 = rt.resolve_event_id(rt_cal, event_id1, week=week1, year=year, institution=institution)
+    event_id2 = rt.resolve_event_id(rt_cal, event_id2, week=week2, year=year, institution=institution)
+    if not event_id1 or not event_id2:
+        return
     rt_cal.swap_shifts(event_id1=event_id1, event_id2=event_id2)
 
 
 if __name__ == '__main__':
-    main()
+    rt.run(main)
@@ -0,0 +1,34 @@
+"""Fixtures for the tests: RTCalendar on the in-memory fake calendar (src/Gcal_fake.py), no Google account needed."""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.Gcal_API import MyCalendar, RTCalendar
+from src.Gcal_executor import RequestExecutor
+from src.Gcal_fake import FakeCalendarBackend, FakeHttp
+
+
+@pytest.fixture
+def backend():
+    return FakeCalendarBackend()
+
+
+def executor():
+    return RequestExecutor(rate=1e9, burst=50, max_concurrency=4, max_retries=3, base_delay=0.01, max_delay=0.1)
+
+
+@pytest.fixture
+def my_cal(backend):
+    return MyCalendar(calendar_id="rt@fake.calendar.google.com", scopes=["https://www.googleapis.com/auth/calendar"],
+                      token="fake", http=FakeHttp(backend), calendar_cache=None, executor=executor())
+
+
+@pytest.fixture
+def rt_cal(backend, tmp_path):
+    cal = RTCalendar(calendar_id="rt@fake.calendar.google.com", token="fake", http=FakeHttp(backend),
+                     calendar_cache=None, executor=executor())
+    cal.use_mirror(str(tmp_path / "event_mirror.sqlite"))
+    return cal
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from google.oauth2.credentials import Credentials
+from src.Gcal_credentials import CredentialManager
+
+scopes = ["https://www.googleapis.com/auth/calendar"]
+
+
+def write_token(path, token, expires_in):
+    credentials = Credentials(token=token, refresh_token="refresh", client_id="id", client_secret="secret",
+                              token_uri="https://oauth2.googleapis.com/token", scopes=scopes,
+                              expiry=datetime.utcnow() + timedelta(seconds=expires_in))
+    path.write_text(credentials.to_json())
+
+
+def stored_token(path):
+    return json.loads(path.read_text())["token"]
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    """
+    Refresh without Google: each refresh gives a new token valid for an hour.
+    """
+    calls = list()
+
+    def refresh(credentials, request):
+        calls.append(credentials.token)
+        credentials.token = f"refreshed{len(calls)}"
+        credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+    monkeypatch.setattr(Credentials, "refresh", refresh)
+    return calls
+
+
+def test_expiring_credentials_are_refreshed_in_place(tmp_path, refreshes):
+    token = tmp_path / "token.json"
+    write_token(token, "first", expires_in=3600)
+    manager = CredentialManager(token=str(token), credentialsfile=None, scopes=scopes)
+    credentials = manager.get()
+
+    # Hours later (in the daemon) the token expires within the refresh margin
+    write_token(token, "first", expires_in=60)
+    credentials.expiry = datetime.utcnow() + timedelta(seconds=60)
+    manager.fresh(credentials)
+    assert credentials.token == "refreshed1" and stored_token(token) == "refreshed1"
+
+    manager.fresh(credentials)
+    assert len(refreshes) == 1
+
+
+def test_token_refreshed_by_other_process_is_used(tmp_path, refreshes):
+    token = tmp_path / "token.json"
+    write_token(token, "first", expires_in=3600)
+    manager = CredentialManager(token=str(token), credentialsfile=None, scopes=scopes)
+    credentials = manager.get()
+
+    write_token(token, "other", expires_in=3600)
+    credentials.expiry = datetime.utcnow() + timedelta(seconds=60)
+    manager.fresh(credentials)
+    assert credentials.token == "other" and not refreshes
+
+
+def test_token_refreshed_in_memory_is_written(tmp_path, refreshes):
+    token = tmp_path / "token.json"
+    write_token(token, "first", expires_in=3600)
+    manager = CredentialManager(token=str(token), credentialsfile=None, scopes=scopes)
+    credentials = manager.get()
+
+    # google-auth refreshed the token after a 401, and the stored one is expired
+    write_token(token, "first", expires_in=-10)
+    credentials.token = "after401"
+    manager.fresh(credentials)
+    assert stored_token(token) == "after401" and not refreshes
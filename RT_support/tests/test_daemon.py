@@ -0,0 +1,20 @@
+import os
+import stat
+from src.Gcal_daemon import CalendarDaemon
+
+
+def test_socket_is_private_from_bind(tmp_path, monkeypatch):
+    # Mode given by bind(), before the daemon's own chmod
+    monkeypatch.setattr(os, "chmod", lambda path, mode: None)
+    socket_file = str(tmp_path / "clinris.sock")
+    umask = os.umask(0o022)
+    try:
+        server = CalendarDaemon(socket_file)
+        # umask of the process is restored
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+    try:
+        assert stat.S_IMODE(os.stat(socket_file).st_mode) & 0o077 == 0
+    finally:
+        server.server_close()
@@ -0,0 +1,21 @@
+import time
+from src.Gcal_executor import TokenBucket
+
+
+def test_batch_larger_than_burst_pays_full_cost():
+    bucket = TokenBucket(rate=100, burst=10)
+    start = time.monotonic()
+    bucket.acquire(50)
+    # 10 tokens in the bucket, 40 more at 100 per second
+    assert time.monotonic() - start >= 0.38
+    start = time.monotonic()
+    bucket.acquire(10)
+    assert time.monotonic() - start >= 0.08
+
+
+def test_burst_is_free():
+    bucket = TokenBucket(rate=1, burst=10)
+    start = time.monotonic()
+    for _ in range(10):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
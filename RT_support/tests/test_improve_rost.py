@@ -0,0 +1,44 @@
+from make_roster import StaffMember
+from src.RT_solver import improve_rost, load_deviation, Fairness
+
+
+def week(who, staff, ukevakt=False):
+    return {"who": list(who), "email": [staff[name].email for name in who], "ukevakt": ukevakt}
+
+
+def test_single_and_shared_weeks_trade():
+    staff = {"Single": StaffMember("Single", "single@example.com", 1.0, True, False),
+             "Pair1": StaffMember("Pair1", "pair1@example.com", 0.5, True, True),
+             "Pair2": StaffMember("Pair2", "pair2@example.com", 0.5, True, True)}
+    # All weeks single: the sharing staff have no load at all
+    rost = {w: week(["Single"], staff) for w in range(1, 9)}
+
+    stats = improve_rost(rost, staff, seconds=5, seed=1)
+
+    assert stats["improvements"] > 0 and stats["local_optimum"]
+    assert load_deviation(rost, staff) == 0
+    assert abs(stats["after"] - Fairness.of_rost(rost, staff).score(rost)) < 1e-9
+    assert all(rost[w]["who"] in (["Single"], ["Pair1", "Pair2"]) for w in rost)
+
+
+def test_no_allowed_moves_is_not_a_local_optimum():
+    staff = {"Only": StaffMember("Only", "only@example.com")}
+    rost = {w: week(["Only"], staff) for w in range(1, 5)}
+
+    stats = improve_rost(rost, staff, seconds=1)
+
+    assert stats["moves"] == 0 and not stats["local_optimum"]
+
+
+def test_same_staff_member_twice_in_a_week():
+    staff = {name: StaffMember(name, f"{name.lower()}@example.com") for name in ("Ola", "Kari", "Per")}
+    rost = {w: week([name], staff) for w, name in enumerate(["Ola", "Kari", "Per", "Ola", "Kari"], start=1)}
+    rost[6] = week(["Per", "Per"], staff)
+    before = Fairness.of_rost(rost, staff).score(rost)
+
+    stats = improve_rost(rost, staff, seconds=5, seed=1)
+
+    assert stats["repaired"] == 1 and abs(stats["before"] - before) < 1e-9
+    assert all(len(set(rost[w]["who"])) == len(rost[w]["who"]) for w in rost)
+    assert abs(stats["after"] - Fairness.of_rost(rost, staff).score(rost)) < 1e-9
+    assert stats["after"] < stats["before"]
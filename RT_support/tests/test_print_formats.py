@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import pytest
+from src.Gcal_profile import start_profiling, stop_profiling
+from src.static_methods import week_to_date
+
+
+@pytest.fixture
+def shifts(rt_cal):
+    for week in (10, 11, 12):
+        rt_cal.add_event(rt_cal.shift_body(week=week, names=["Ola", "Kari"], emails=["ola@example.com",
+                                                                                  "kari@example.com"], year=2026))
+    # Calendar change and a full sync of an outdated mirror print status messages
+    rt_cal.change_calendar(calendar_name="someone@example.com")
+    rt_cal.change_calendar(calendar_name="1.linje-vaktliste")
+    rt_cal.mirror.sync(rt_cal)
+    rt_cal.mirror.db.execute("UPDATE sync SET sync_token = '999999'")
+    rt_cal.mirror.synced.clear()
+
+
+def printed(rt_cal, capsys, output):
+    capsys.readouterr()
+    rt_cal.set_output(output)
+    rt_cal.get_print_weeks(week1=10, year1=2026, week2=13, year2=2026)
+    captured = capsys.readouterr()
+    return captured.out, captured.err
+
+
+def test_json_is_clean(rt_cal, shifts, capsys):
+    out, err = printed(rt_cal, capsys, "json")
+    events = json.loads(out)
+    assert [event["week"] for event in events] == [10, 11, 12]
+    assert events[0]["start"] == str(week_to_date(2026, 10)[0])
+    assert "out of date" in err
+
+
+def test_jsonl_is_clean(rt_cal, shifts, capsys):
+    out, err = printed(rt_cal, capsys, "jsonl")
+    assert [json.loads(line)["week"] for line in out.splitlines()] == [10, 11, 12]
+
+
+@pytest.mark.parametrize("output, delimiter", [("csv", ","), ("tsv", "\t")])
+def test_csv_is_clean(rt_cal, shifts, capsys, output, delimiter):
+    out, err = printed(rt_cal, capsys, output)
+    rows = list(csv.DictReader(io.StringIO(out), delimiter=delimiter))
+    assert [row["week"] for row in rows] == ["10", "11", "12"]
+
+
+def test_ics_is_clean(rt_cal, shifts, capsys):
+    out, err = printed(rt_cal, capsys, "ics")
+    lines = out.splitlines()
+    assert lines[0] == "BEGIN:VCALENDAR" and lines[-1] == "END:VCALENDAR"
+    assert len([line for line in lines if line == "BEGIN:VEVENT"]) == 3
+
+
+def test_json_is_clean_with_profile(rt_cal, shifts, capsys):
+    start_profiling()
+    rt_cal.set_output("json")
+    rt_cal.get_print_weeks(week1=10, year1=2026, week2=13, year2=2026)
+    stop_profiling()
+    captured = capsys.readouterr()
+    assert [event["week"] for event in json.loads(captured.out)] == [10, 11, 12]
+    assert "Phase" in captured.err
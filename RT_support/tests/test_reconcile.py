@@ -0,0 +1,62 @@
+def shift(week, *names, institution="uiT"):
+    return {"week": week, "names": list(names), "emails": [f"{name.lower()}@example.com" for name in names],
+            "institution": institution, "ukevakt": False, "year": 2026}
+
+
+def shifts_in_calendar(backend, calendar_id):
+    events = [event for event in backend.events[calendar_id].values() if event.get("status") != "cancelled"]
+    return sorted((event["start"]["date"], event["summary"], tuple(sorted(who["email"] for who in event["attendees"])))
+                  for event in events)
+
+
+def test_plan_and_apply_roster(rt_cal, backend):
+    for existing in [shift(10, "Ola"), shift(11, "Kari"), shift(11, "Kari"), shift(12, "Per"),
+                     shift(12, "Nils", institution="NTNU")]:
+        rt_cal.add_event(rt_cal.shift_body(**existing))
+    roster = [shift(10, "Ola"), shift(11, "Per", "Kari"), shift(13, "Ola")]
+
+    plan = rt_cal.plan_roster(roster)
+    assert sorted((change["action"], str(change["week"])) for change in plan) == \
+        [("delete", ""), ("delete", "11"), ("insert", "13"), ("patch", "11")]
+    # Attendee entry (and response) of Kari is kept, Per is added
+    patch = [change for change in plan if change["action"] == "patch"][0]
+    assert [who["email"] for who in patch["body"]["attendees"]] == ["kari@example.com", "per@example.com"]
+
+    results = rt_cal.apply_plan(plan)
+    assert all(error is None for response, error in results.values())
+    assert rt_cal.plan_roster(roster) == []
+
+    # Shifts of other institutions are not touched
+    expected = [rt_cal.shift_body(**s) for s in roster + [shift(12, "Nils", institution="NTNU")]]
+    assert shifts_in_calendar(backend, rt_cal.id) == sorted(
+        (body["start"]["date"], body["summary"], tuple(sorted(who["email"] for who in body["attendees"])))
+        for body in expected)
+
+
+def test_apply_plan_keeps_edits_made_after_plan(rt_cal, backend):
+    event = rt_cal.add_event(rt_cal.shift_body(**shift(10, "Ola")))
+    plan = rt_cal.plan_roster([shift(10, "Kari")])
+
+    # Someone else edits the shift between plan and apply
+    backend.events[rt_cal.id][event["id"]]["summary"] = "uiT: Per"
+    backend.touch(rt_cal.id, backend.events[rt_cal.id][event["id"]])
+
+    results = rt_cal.apply_plan(plan)
+    assert results[0][1] is not None and results[0][1].resp.status == 412
+    assert backend.events[rt_cal.id][event["id"]]["summary"] == "uiT: Per"
+
+
+def test_plan_roster_keeps_events_that_are_not_shifts(rt_cal, backend, capsys):
+    rt_cal.add_event(rt_cal.shift_body(**shift(10, "Ola")))
+    meetings = [rt_cal.add_event({"summary": "uiT: Support meeting", "start": {"date": "2026-03-09"},
+                                  "end": {"date": "2026-03-10"}}),
+                rt_cal.add_event({"summary": "uiT: Course", "start": {"date": "2026-03-10"},
+                                  "end": {"date": "2026-03-13"}})]
+    roster = [shift(10, "Kari"), shift(11, "Per")]
+
+    plan = rt_cal.plan_roster(roster)
+    assert sorted((change["action"], str(change["week"])) for change in plan) == [("insert", "11"), ("patch", "10")]
+    assert "Not changing 2 uiT event(s)" in capsys.readouterr().out
+
+    rt_cal.apply_plan(plan)
+    assert all(backend.events[rt_cal.id][event["id"]]["status"] == "confirmed" for event in meetings)
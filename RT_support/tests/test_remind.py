@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+from src.Gcal_API import max_reminder_minutes
+
+
+def shift(my_cal, first_day, email):
+    return my_cal.add_event({"summary": f"UiT: {email}", "start": {"date": str(first_day)},
+                             "end": {"date": str(first_day + timedelta(days=5))}, "attendees": [{"email": email}]})
+
+
+def test_remind_unconfirmed_on_my_calendar(my_cal, backend):
+    today = date.today()
+    started = shift(my_cal, today - timedelta(days=2), "started@example.com")
+    next_week = shift(my_cal, today + timedelta(days=7), "next@example.com")
+    far = shift(my_cal, today + timedelta(days=33), "far@example.com")
+
+    reminded = my_cal.remind_unconfirmed(weeks=6)
+
+    assert [event["id"] for event in reminded] == [next_week["id"]]
+    events = backend.events["rt@fake.calendar.google.com"]
+    minutes = events[next_week["id"]]["reminders"]["overrides"][0]["minutes"]
+    assert 0 <= minutes <= max_reminder_minutes
+    assert "reminders" not in events[started["id"]]
+    assert "reminders" not in events[far["id"]]
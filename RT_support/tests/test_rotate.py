@@ -0,0 +1,50 @@
+import pytest
+
+
+def add_shifts(rt_cal, *names):
+    return [rt_cal.add_event(rt_cal.shift_body(week=10 + i, names=[name], emails=[f"{name.lower()}@example.com"],
+                                               year=2026)) for i, name in enumerate(names)]
+
+
+@pytest.mark.parametrize("repeat", [lambda a, b, c: [a, b, a], lambda a, b, c: [a, a], lambda a, b, c: [a]])
+def test_rotate_rejects_repeated_ids(rt_cal, backend, repeat):
+    events = add_shifts(rt_cal, "Ola", "Kari", "Per")
+    backend.reset_stats()
+
+    assert not rt_cal.rotate_shifts(repeat(*(event["id"] for event in events)))
+    # Rejected before any read or write
+    assert backend.stats["calls"] == 0
+
+
+def summaries(backend, rt_cal, events):
+    return [backend.events[rt_cal.id][event["id"]]["summary"] for event in events]
+
+
+def test_rotate_moves_staff_to_next_shift(rt_cal, backend):
+    events = add_shifts(rt_cal, "Ola", "Kari", "Per")
+    backend.events[rt_cal.id][events[1]["id"]]["summary"] += " (ukevakt)"
+
+    assert rt_cal.rotate_shifts([event["id"] for event in events])
+    # (ukevakt) stays with the shift
+    assert summaries(backend, rt_cal, events) == ["uiT: Per", "uiT: Ola (ukevakt)", "uiT: Kari"]
+    assert [backend.events[rt_cal.id][event["id"]]["attendees"][0]["email"] for event in events] == \
+        ["per@example.com", "ola@example.com", "kari@example.com"]
+
+
+def test_rotate_rolls_back_when_a_patch_fails(rt_cal, backend, monkeypatch):
+    events = add_shifts(rt_cal, "Ola", "Kari", "Per")
+    handle = backend.handle
+
+    def edited_by_someone_else(method, path, query, headers, body):
+        # The last shift is changed between read and patch, so its patch fails (412 Precondition Failed)
+        event = backend.events[rt_cal.id][events[2]["id"]]
+        if method == "PATCH" and path.endswith(event["id"]) and event["summary"] == "uiT: Per":
+            event["summary"] = "uiT: Nils"
+            backend.touch(rt_cal.id, event)
+        return handle(method, path, query, headers, body)
+    monkeypatch.setattr(backend, "handle", edited_by_someone_else)
+
+    assert not rt_cal.rotate_shifts([event["id"] for event in events])
+    assert summaries(backend, rt_cal, events) == ["uiT: Ola", "uiT: Kari", "uiT: Nils"]
+    assert [backend.events[rt_cal.id][event["id"]]["attendees"][0]["email"] for event in events[:2]] == \
+        ["ola@example.com", "kari@example.com"]
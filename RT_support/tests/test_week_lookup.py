@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+import pytest
+from src.static_methods import week_to_date, date_to_week
+
+
+def test_find_shift_in_created_week(rt_cal):
+    ids = dict()
+    for week in range(9, 14):
+        event = rt_cal.add_event(rt_cal.shift_body(week=week, names=[f"Staff{week}"], emails=[f"s{week}@example.com"],
+                                                   institution="UiT", year=2026))
+        ids[week] = event["id"]
+
+    for week in range(9, 14):
+        assert rt_cal.find_shift(week=week, year=2026) == ids[week]
+
+
+def test_find_shift_around_new_year(rt_cal):
+    ids = dict()
+    for year, week in [(2025, 51), (2025, 52), (2026, 1), (2026, 2)]:
+        ids[(year, week)] = rt_cal.add_event(rt_cal.shift_body(week=week, names=["Staff"], emails=["s@example.com"],
+                                                               year=year))["id"]
+
+    for (year, week), event_id in ids.items():
+        assert rt_cal.find_shift(week=week, year=year) == event_id
+
+
+def test_date_to_week_inverts_week_to_date():
+    for year in (2021, 2025, 2026, 2027):
+        for week in range(1, 53):
+            assert date_to_week(week_to_date(year, week)[0]) == (year, week)
+
+
+def test_find_shift_sees_own_changes_within_mirror_max_age(rt_cal):
+    # As in the daemon: the mirror is not synced again within max_age, unless we changed the calendar
+    rt_cal.use_mirror(rt_cal.mirror.filename, max_age=60)
+    ola, kari = [rt_cal.add_event(rt_cal.shift_body(week=week, names=[name], emails=[f"{name.lower()}@example.com"],
+                                                    year=2026))["id"] for week, name in [(10, "Ola"), (11, "Kari")]]
+    assert rt_cal.find_shift(week=10, year=2026, attendee="ola@example.com") == ola
+
+    assert rt_cal.swap_shifts(ola, kari)
+    assert rt_cal.find_shift(week=10, year=2026, attendee="ola@example.com") is None
+    assert rt_cal.find_shift(week=11, year=2026, attendee="ola@example.com") == kari
+
+    rt_cal.delete_event(kari)
+    assert rt_cal.find_shift(week=11, year=2026) is None
+
+
+def test_find_shift_without_mirror(rt_cal, backend):
+    ids = dict()
+    for week, name, institution in [(10, "Ola", "UiT"), (11, "Kari", "UiT"), (11, "Nils", "NTNU"), (12, "Ola", "UiT")]:
+        ids[(week, name)] = rt_cal.add_event(rt_cal.shift_body(week=week, names=[name], institution=institution,
+                                                               emails=[f"{name.lower()}@example.com"], year=2026))["id"]
+    mirrored = [rt_cal.find_shift(week=11, year=2026, institution="ntnu"),
+                rt_cal.find_shift(week=12, year=2026, attendee="ola@example.com"),
+                rt_cal.find_shift(week=11, year=2026)]
+
+    rt_cal.mirror = None
+    backend.reset_stats()
+    assert [rt_cal.find_shift(week=11, year=2026, institution="ntnu"),
+            rt_cal.find_shift(week=12, year=2026, attendee="ola@example.com"),
+            rt_cal.find_shift(week=11, year=2026)] == mirrored == [ids[(11, "Nils")], ids[(12, "Ola")], None]
+    # One events.list for each week, no full sync
+    assert backend.stats["calls"] == 3
+
+
+@pytest.mark.parametrize("mirror", [True, False])
+def test_find_next_shift(rt_cal, mirror):
+    ids = list()
+    for days in (-14, 14, 28):
+        year, week = date_to_week(date.today() + timedelta(days=days))
+        ids.append(rt_cal.add_event(rt_cal.shift_body(week=week, names=["Ola"], emails=["ola@example.com"],
+                                                      year=year))["id"])
+    if not mirror:
+        rt_cal.mirror = None
+    assert rt_cal.find_shift(attendee="ola@example.com") == ids[1]
+    assert rt_cal.find_shift(attendee="kari@example.com") is None